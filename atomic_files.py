@@ -0,0 +1,91 @@
+# atomic_files.py
+
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Callable, Optional
+
+
+def write_atomic(path: str, content: str, prefix: str = '.tmp-', fsync: bool = False):
+    """Grava o arquivo em um temporário no mesmo diretório e o renomeia (quem lê nunca vê um arquivo pela metade)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=prefix, suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class DebouncedJsonWriter:
+    """
+    Agrupa várias alterações seguidas em uma única escrita atômica de um arquivo JSON,
+    feita em uma thread de timer. `snapshot` é chamado no momento da escrita e deve
+    devolver uma cópia dos dados feita sob o lock do dono; a serialização e a escrita
+    acontecem fora desse lock, então quem lê ou altera os dados não espera o disco.
+    """
+
+    def __init__(self, path: str, snapshot: Callable[[], Any], debounce_seconds: float, prefix: str = '.tmp-',
+                 fsync: bool = False, on_written: Optional[Callable[[], None]] = None, **dump_kwargs):
+        self.path = path
+        self.debounce_seconds = debounce_seconds
+        self._snapshot = snapshot
+        self._prefix = prefix
+        self._fsync = fsync
+        self._on_written = on_written
+        self._dump_kwargs = dump_kwargs
+        self._state_lock = threading.Lock()
+        # Serializa as escritas (timer, flush explícito e atexit) sem bloquear os donos dos dados
+        self._write_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._dirty = False
+        self._generation = 0
+
+    @property
+    def pending(self) -> bool:
+        """True enquanto houver alterações que ainda não chegaram ao disco."""
+        return self._dirty
+
+    def schedule(self):
+        """Marca os dados como alterados e (re)inicia a janela de debounce."""
+        with self._state_lock:
+            self._dirty = True
+            self._generation += 1
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce_seconds, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except OSError as e:
+            print(f"Aviso: não foi possível gravar '{self.path}': {e}")
+
+    def flush(self):
+        """Grava imediatamente as alterações pendentes no disco."""
+        with self._write_lock:
+            with self._state_lock:
+                if self._timer:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                generation = self._generation
+            content = json.dumps(self._snapshot(), **self._dump_kwargs)
+            write_atomic(self.path, content, prefix=self._prefix, fsync=self._fsync)
+            if self._on_written:
+                self._on_written()
+            with self._state_lock:
+                # Alterações feitas durante a escrita continuam pendentes para a próxima
+                if self._generation == generation:
+                    self._dirty = False
@@ -0,0 +1,63 @@
+# autocomplete_index.py
+
+import bisect
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Quantidade máxima de sugestões aceita pelo Discord em um autocomplete.
+MAX_SUGGESTIONS = 25
+
+
+class PrefixIndex:
+    """
+    Lista ordenada de (texto em casefold, texto original) para sugestões por prefixo
+    com bisect. Quando os prefixos não preenchem o limite, completa com os textos que
+    contêm o termo em qualquer posição.
+    """
+
+    def __init__(self, items: Iterable[str] = ()):
+        self._entries: List[Tuple[str, str]] = sorted({(item.casefold(), item) for item in items if item})
+
+    def search(self, query: str, limit: int = MAX_SUGGESTIONS) -> List[str]:
+        folded = (query or "").strip().casefold()
+        if not folded:
+            return [original for _, original in self._entries[:limit]]
+
+        matches = []
+        index = bisect.bisect_left(self._entries, (folded, ""))
+        while index < len(self._entries) and len(matches) < limit and self._entries[index][0].startswith(folded):
+            matches.append(self._entries[index][1])
+            index += 1
+
+        if len(matches) < limit:
+            for name, original in self._entries:
+                if folded in name and not name.startswith(folded):
+                    matches.append(original)
+                    if len(matches) >= limit:
+                        break
+        return matches
+
+
+class TitleIndex:
+    """
+    Títulos dos cards de uma base (page_id -> título) com busca por prefixo. As
+    alterações marcam o índice como sujo, e a lista ordenada é refeita só na
+    próxima busca.
+    """
+
+    def __init__(self, titles: Optional[Dict[str, str]] = None):
+        self._titles: Dict[str, str] = dict(titles or {})
+        self._index: Optional[PrefixIndex] = None
+
+    def set(self, page_id: str, title: str):
+        if self._titles.get(page_id) != title:
+            self._titles[page_id] = title
+            self._index = None
+
+    def discard(self, page_id: str):
+        if self._titles.pop(page_id, None) is not None:
+            self._index = None
+
+    def search(self, query: str, limit: int = MAX_SUGGESTIONS) -> List[str]:
+        if self._index is None:
+            self._index = PrefixIndex(self._titles.values())
+        return self._index.search(query, limit)
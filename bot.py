@@ -6,24 +6,38 @@ from discord.ext import commands
 from discord.ui import Select, View # <-- CORREÇÃO: Importação do local correto
 import os
 from dotenv import load_dotenv
-from typing import Optional
+from typing import List, Optional
 import asyncio 
 # Módulos locais
-from notion_integration import NotionIntegration, NotionAPIError
+from notion_integration import NotionAPIError, get_notion_integration
 from config_utils import save_config, load_config
 from ui_components import (
     SelectView,
-    PaginationView,
     SearchModal,
     CardModal,
     ManagementView,
+    send_search_results,
+)
+from webhook_server import start_server
+from ia_processor import summary_cache
+from page_index import index_thread_page
+from bulk_cards import (
+    BULK_CARD_MAX_FILE_BYTES,
+    BULK_CARD_MAX_ROWS,
+    build_error_report,
+    create_cards_in_bulk,
+    map_columns,
+    parse_bulk_file,
+    rows_from_messages,
+    throttled_progress,
 )
-from webhook_server import run_server
 
 # Carregar variáveis de ambiente e inicializar bot/notion
 load_dotenv()
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 DISCORD_GUILD_ID = os.getenv("DISCORD_GUILD_ID")
+# Intervalo (em segundos) entre as linhas de métricas (fila do Notion e caches) no log; 0 desativa.
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "300"))
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -31,7 +45,29 @@ intents.guilds = True
 intents.messages = True
 
 bot = commands.Bot(command_prefix="!", intents=intents)
-notion = NotionIntegration()
+notion = get_notion_integration()
+# Tarefa que escreve as métricas no log periodicamente (iniciada uma única vez no on_ready)
+_metrics_task: Optional[asyncio.Task] = None
+
+
+# --- MÉTRICAS ---
+
+def _metrics_lines() -> List[str]:
+    """Métricas da fila de requisições ao Notion e dos caches de schema e de resumos."""
+    scheduler = notion.get_scheduler_stats()
+    schema = notion.get_schema_cache_stats()
+    summaries = summary_cache.stats()
+    lines = [f"Fila do Notion: {scheduler['queue_depth']} pendente(s) (máx. {scheduler['max_queue_depth']}), {scheduler['rate_limited']} resposta(s) 429"]
+    for lane, lane_stats in scheduler['lanes'].items():
+        lines.append(f"Faixa {lane}: {lane_stats['requests']} requisição(ões), espera média {lane_stats['avg_wait']:.2f}s, máx. {lane_stats['max_wait']:.2f}s")
+    lines.append(f"Cache de schemas: {schema['hits']} acerto(s), {schema['misses']} falha(s), {schema['entries']} base(s)")
+    lines.append(f"Cache de resumos: {summaries['hits']} acerto(s), {summaries['misses']} falha(s)")
+    return lines
+
+async def _log_metrics_periodically():
+    while True:
+        await asyncio.sleep(METRICS_LOG_INTERVAL)
+        print("📈 Métricas: " + " | ".join(_metrics_lines()))
 
 
 # --- FUNÇÃO AUXILIAR DE CONFIGURAÇÃO ---
@@ -47,7 +83,9 @@ async def run_full_config_flow(interaction: Interaction, url: str, is_update: bo
         # Salva a URL inicial para garantir que o canal é reconhecido como configurado
         save_config(interaction.guild_id, config_channel_id, {'notion_url': url})
 
-        all_properties = notion.get_properties_for_interaction(url)
+        # Garante que a reconfiguração enxergue o schema atual da base
+        notion.invalidate_schema(url)
+        all_properties = await notion.get_properties_for_interaction(url)
         property_names = [prop['name'] for prop in all_properties]
 
         async def run_selection_process(prompt_title, prompt_description, original_interaction):
@@ -113,9 +151,12 @@ async def on_ready():
         await bot.tree.sync()
         print("Comandos sincronizados globalmente.")
         
-    # Inicia o servidor de webhook quando o bot estiver pronto
-    loop = asyncio.get_event_loop()
-    run_server(bot, loop)
+    # Inicia o servidor de webhook no mesmo event loop do bot (idempotente em reconexões)
+    await start_server(bot)
+
+    global _metrics_task
+    if METRICS_LOG_INTERVAL > 0 and _metrics_task is None:
+        _metrics_task = asyncio.create_task(_log_metrics_periodically())
 
     print(f"✅ {bot.user} está online e pronto para uso!")
 
@@ -168,7 +209,7 @@ async def interactive_card(interaction: Interaction):
         if not config or 'notion_url' not in config:
             return await interaction.response.send_message("❌ O Notion ainda não foi configurado para este canal. Peça para um admin usar `/config`.", ephemeral=True)
 
-        all_properties = notion.get_properties_for_interaction(config['notion_url'])
+        all_properties = await notion.get_properties_for_interaction(config['notion_url'])
 
         thread_context = interaction.channel if isinstance(interaction.channel, discord.Thread) else None
         topic_title = thread_context.name if thread_context else None
@@ -212,15 +253,118 @@ async def interactive_card(interaction: Interaction):
             await interaction.response.send_message(error_message, ephemeral=True)
 
 
+@bot.tree.command(name="card_bulk", description="Cria vários cards de uma vez a partir de um CSV/JSON ou das mensagens do tópico.")
+@app_commands.describe(
+    arquivo="CSV ou JSON com um card por linha; as colunas são os nomes das propriedades.",
+    mensagens="Sem arquivo, dentro de um tópico: quantas mensagens recentes viram cards (padrão: 20).",
+)
+async def card_bulk(interaction: Interaction, arquivo: Optional[discord.Attachment] = None, mensagens: Optional[app_commands.Range[int, 1, 100]] = None):
+    try:
+        config_channel_id = interaction.channel.parent_id if isinstance(interaction.channel, discord.Thread) else interaction.channel.id
+        config = load_config(interaction.guild_id, config_channel_id)
+        if not config or 'notion_url' not in config:
+            return await interaction.response.send_message("❌ O Notion ainda não foi configurado para este canal. Peça para um admin usar `/config`.", ephemeral=True)
+
+        thread_context = interaction.channel if isinstance(interaction.channel, discord.Thread) else None
+        if not arquivo and not thread_context:
+            return await interaction.response.send_message("❌ Envie um arquivo CSV/JSON ou use o comando dentro de um tópico.", ephemeral=True)
+        if arquivo and arquivo.size > BULK_CARD_MAX_FILE_BYTES:
+            return await interaction.response.send_message(f"❌ Arquivo muito grande. O limite é {BULK_CARD_MAX_FILE_BYTES // 1024} KB.", ephemeral=True)
+
+        await interaction.response.defer(thinking=True)
+
+        all_properties = await notion.get_properties_for_interaction(config['notion_url'])
+        title_prop = next((p for p in all_properties if p['type'] == 'title'), None)
+        if not title_prop:
+            return await interaction.followup.send("❌ A base de dados não tem uma propriedade de título.")
+
+        # Mesmas propriedades do /card, exceto as preenchidas automaticamente
+        auto_props = [config.get('topic_link_property_name'), config.get('individual_person_prop'), config.get('collective_person_prop')]
+        allowed_names = [name for name in config.get('create_properties', []) if name and name not in auto_props]
+        allowed_properties = [title_prop] + [p for p in all_properties if p['name'] in allowed_names and p['type'] != 'title']
+
+        if arquivo:
+            try:
+                raw_rows = parse_bulk_file(arquivo.filename, await arquivo.read())
+            except ValueError as e:
+                return await interaction.followup.send(f"❌ Não foi possível ler `{arquivo.filename}`: {e}")
+        else:
+            history = [message async for message in thread_context.history(limit=mensagens or 20, oldest_first=False)]
+            raw_rows = rows_from_messages(list(reversed(history)), title_prop['name'])
+
+        if not raw_rows:
+            return await interaction.followup.send("❌ Nenhuma linha encontrada para criar cards.")
+        if len(raw_rows) > BULK_CARD_MAX_ROWS:
+            return await interaction.followup.send(f"❌ Muitas linhas ({len(raw_rows)}). O máximo por importação é {BULK_CARD_MAX_ROWS}.")
+
+        rows, ignored_columns = map_columns(raw_rows, allowed_properties)
+
+        fixed_properties = {}
+        if config.get('individual_person_prop'):
+            fixed_properties[config['individual_person_prop']] = interaction.user.display_name
+        if config.get('topic_link_property_name') and thread_context:
+            fixed_properties[config['topic_link_property_name']] = thread_context.jump_url
+
+        progress_message = await interaction.followup.send(f"⚙️ Validando {len(rows)} linha(s)...", wait=True)
+        created, errors = await create_cards_in_bulk(
+            notion, config, rows, allowed_properties,
+            fixed_properties=fixed_properties,
+            on_progress=throttled_progress(progress_message),
+            on_created=(lambda page: index_thread_page(page.get('id'), thread_context)) if thread_context else None,
+        )
+
+        summary = f"✅ **{len(created)}** de {len(rows)} card(s) criados."
+        if ignored_columns:
+            summary += f"\n⚠️ Colunas ignoradas (não são propriedades de criação): `{', '.join(ignored_columns)}`"
+        if errors:
+            preview = "\n".join(f"• Linha {row_number}: {error}" for row_number, error in errors[:10])
+            more = f"\n... e mais {len(errors) - 10} erro(s)." if len(errors) > 10 else ""
+            summary += f"\n\n❌ **{len(errors)}** linha(s) com erro:\n{preview}{more}"
+            await progress_message.edit(content=summary[:2000])
+            await interaction.followup.send("📄 Relatório completo de erros:", file=build_error_report(errors))
+        else:
+            await progress_message.edit(content=summary[:2000])
+
+    except NotionAPIError as e:
+        msg = f"❌ Erro ao acessar o Notion: {e}"
+        if not interaction.response.is_done(): await interaction.response.send_message(msg, ephemeral=True)
+        else: await interaction.followup.send(msg)
+    except Exception as e:
+        msg = f"🔴 Erro inesperado: {e}"
+        if not interaction.response.is_done(): await interaction.response.send_message(msg, ephemeral=True)
+        else: await interaction.followup.send(msg)
+        print(f"Erro inesperado no /card_bulk: {e}")
+
+
+def _load_channel_config(interaction: Interaction):
+    """Carrega a configuração do canal da interação (ou do canal pai, se for um tópico)."""
+    config_channel_id = interaction.channel.parent_id if isinstance(interaction.channel, discord.Thread) else interaction.channel.id
+    return load_config(interaction.guild_id, config_channel_id)
+
+def _to_choices(values: List[str]) -> List[app_commands.Choice[str]]:
+    # O Discord aceita até 25 sugestões, com nome e valor de até 100 caracteres
+    return [app_commands.Choice(name=value[:100], value=value[:100]) for value in values[:25]]
+
+
 @bot.tree.command(name="busca", description="Busca ou edita um card no Notion.")
-async def interactive_search(interaction: Interaction):
+@app_commands.describe(
+    termo="Opcional: termo para buscar em todas as propriedades de uma vez.",
+    propriedade="Opcional: propriedade para buscar diretamente, sem os menus.",
+    valor="Opcional: valor procurado na propriedade escolhida.",
+)
+async def interactive_search(interaction: Interaction, termo: Optional[str] = None, propriedade: Optional[str] = None, valor: Optional[str] = None):
     try:
         config_channel_id = interaction.channel.parent_id if isinstance(interaction.channel, discord.Thread) else interaction.channel.id
         config = load_config(interaction.guild_id, config_channel_id)
         if not config or 'notion_url' not in config:
             return await interaction.response.send_message("❌ O Notion não foi configurado para este canal. Use `/config`.", ephemeral=True)
 
-        all_properties = notion.get_properties_for_interaction(config['notion_url'])
+        if termo:
+            # Busca em todas as propriedades, ordenada por relevância quando o índice local está ativo
+            await interaction.response.defer(thinking=True, ephemeral=True)
+            return await send_search_results(interaction, notion, config, termo, None)
+
+        all_properties = await notion.get_properties_for_interaction(config['notion_url'])
         display_properties_names = config.get('display_properties', [])
         if not display_properties_names:
             return await interaction.response.send_message("❌ As propriedades para busca não foram configuradas. Use `/config`.", ephemeral=True)
@@ -229,6 +373,14 @@ async def interactive_search(interaction: Interaction):
         if not searchable_options:
             return await interaction.response.send_message("❌ Nenhuma propriedade pesquisável configurada.", ephemeral=True)
 
+        if propriedade and valor:
+            # Busca direta com os valores escolhidos no autocomplete (sem o limite de 25 opções dos menus)
+            selected_property = next((p for p in searchable_options if p['name'] == propriedade), None)
+            if not selected_property:
+                return await interaction.response.send_message(f"❌ A propriedade '{propriedade}' não está entre as propriedades pesquisáveis.", ephemeral=True)
+            await interaction.response.defer(thinking=True, ephemeral=True)
+            return await send_search_results(interaction, notion, config, valor, selected_property)
+
         class PropertySelect(Select):
             def __init__(self, searchable_props, author_id):
                 self.searchable_props = searchable_props
@@ -253,17 +405,10 @@ async def interactive_search(interaction: Interaction):
 
                         async def callback(self, sub_inter: Interaction):
                             await sub_inter.response.defer(thinking=True, ephemeral=True)
-                            search_term = self.values[0]
-                            cards = notion.search_in_database(config['notion_url'], search_term, selected_property['name'], selected_property['type'])
-                            results = cards.get('results', [])
-                            if not results:
-                                return await sub_inter.followup.send(f"❌ Nenhum resultado para '{search_term}'.", ephemeral=True)
-
-                            await sub_inter.followup.send(f"✅ {len(results)} resultado(s) encontrado(s)!", ephemeral=True)
-
-                            view = PaginationView(sub_inter.user, results, config, notion, actions=['edit', 'delete', 'share'])
-                            view.update_nav_buttons()
-                            await sub_inter.followup.send(embed=await view.get_page_embed(), view=view, ephemeral=True)
+                            try:
+                                await send_search_results(sub_inter, notion, config, self.values[0], selected_property)
+                            except NotionAPIError as e:
+                                await sub_inter.followup.send(f"❌ Erro com o Notion: {e}", ephemeral=True)
 
                     view_options = View(timeout=120.0)
                     view_options.add_item(OptionSelect())
@@ -286,19 +431,95 @@ async def interactive_search(interaction: Interaction):
         print(f"Erro inesperado no /busca: {e}")
 
 
+@interactive_search.autocomplete('termo')
+async def busca_termo_autocomplete(interaction: Interaction, current: str) -> List[app_commands.Choice[str]]:
+    config = _load_channel_config(interaction)
+    if not config or 'notion_url' not in config:
+        return []
+    return _to_choices(notion.suggest_card_titles(config['notion_url'], current))
+
+
+@interactive_search.autocomplete('propriedade')
+async def busca_propriedade_autocomplete(interaction: Interaction, current: str) -> List[app_commands.Choice[str]]:
+    config = _load_channel_config(interaction)
+    if not config or 'notion_url' not in config:
+        return []
+    folded = current.casefold()
+    names = [name for name in config.get('display_properties', []) if folded in name.casefold()]
+    return _to_choices(names)
+
+
+@interactive_search.autocomplete('valor')
+async def busca_valor_autocomplete(interaction: Interaction, current: str) -> List[app_commands.Choice[str]]:
+    config = _load_channel_config(interaction)
+    prop_name = interaction.namespace.propriedade
+    if not config or 'notion_url' not in config or not prop_name:
+        return []
+    try:
+        schema = await notion.get_database_properties(config['notion_url'])
+        prop_type = (schema.get(prop_name) or {}).get('type')
+        if prop_type == 'title':
+            return _to_choices(notion.suggest_card_titles(config['notion_url'], current))
+        if prop_type == 'people':
+            return _to_choices(notion.suggest_people(current))
+        return _to_choices(await notion.suggest_property_options(config['notion_url'], prop_name, current))
+    except NotionAPIError as e:
+        print(f"Erro no autocomplete do /busca: {e}")
+        return []
+
+
+@bot.tree.command(name="status", description="(Admin) Mostra as métricas da fila do Notion e dos caches.")
+@app_commands.checks.has_permissions(administrator=True)
+async def status_command(interaction: Interaction):
+    embed = discord.Embed(title="📈 Métricas do bot", description="\n".join(f"• {line}" for line in _metrics_lines()), color=Color.blue())
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@status_command.error
+async def status_command_error(interaction: Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.MissingPermissions):
+        message = "❌ Você precisa ser um administrador para usar este comando."
+    else:
+        message = f"🔴 Um erro de comando ocorreu: {error}"
+        print(f"Erro no comando /status: {error}")
+    try:
+        await interaction.response.send_message(message, ephemeral=True)
+    except discord.errors.HTTPException as e:
+        print(f"Não foi possível enviar a mensagem de erro: {e}")
+
+
 @bot.tree.command(name="num_cards", description="Mostra o total de cards no banco de dados do canal.")
-async def num_cards(interaction: Interaction):
+@app_commands.describe(agrupar_por="Opcional: propriedade de Status/Select para detalhar a contagem.")
+async def num_cards(interaction: Interaction, agrupar_por: Optional[str] = None):
     try:
         config_channel_id = interaction.channel.parent_id if isinstance(interaction.channel, discord.Thread) else interaction.channel.id
         config = load_config(interaction.guild_id, config_channel_id)
         if not config or 'notion_url' not in config:
             return await interaction.response.send_message("❌ O Notion não foi configurado para este canal. Use `/config`.", ephemeral=True)
-        count = notion.get_database_count(config['notion_url'])
-        await interaction.response.send_message(f"📊 O banco de dados deste canal contém **{count}** cards.")
+
+        # Bases grandes exigem várias páginas de consulta, então adiamos a resposta
+        await interaction.response.defer(thinking=True)
+        counts = await notion.count_database(config['notion_url'], group_by=agrupar_por)
+        message = f"📊 O banco de dados deste canal contém **{counts['total']}** cards."
+        if agrupar_por and counts['groups']:
+            message += f"\n\nPor **{agrupar_por}**:"
+            groups = sorted(counts['groups'].items(), key=lambda item: -item[1])
+            # Mantém a mensagem dentro do limite de 2000 caracteres do Discord (multi_select pode ter muitas tags)
+            for shown, (value, count) in enumerate(groups):
+                line = f"\n• **{value}**: {count}"
+                remaining_text = f"\n… e mais {len(groups) - shown} valor(es)."
+                if len(message) + len(line) + len(remaining_text) > 2000:
+                    message += remaining_text
+                    break
+                message += line
+        await interaction.followup.send(message)
     except NotionAPIError as e:
-        await interaction.response.send_message(f"❌ Erro ao acessar o Notion: {e}", ephemeral=True)
+        msg = f"❌ Erro ao acessar o Notion: {e}"
+        if not interaction.response.is_done(): await interaction.response.send_message(msg, ephemeral=True)
+        else: await interaction.followup.send(msg, ephemeral=True)
     except Exception as e:
-        await interaction.response.send_message(f"🔴 Erro inesperado: {e}", ephemeral=True)
+        msg = f"🔴 Erro inesperado: {e}"
+        if not interaction.response.is_done(): await interaction.response.send_message(msg, ephemeral=True)
+        else: await interaction.followup.send(msg, ephemeral=True)
         print(f"Erro inesperado no /num_cards: {e}")
 
 
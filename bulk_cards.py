@@ -0,0 +1,198 @@
+# bulk_cards.py
+
+import asyncio
+import csv
+import io
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import discord
+
+from notion_integration import NotionIntegration, NotionAPIError
+from notion_scheduler import background_priority
+
+# Quantidade máxima de linhas (cards) aceitas em uma única importação.
+BULK_CARD_MAX_ROWS = int(os.getenv("BULK_CARD_MAX_ROWS", "500"))
+# Tamanho máximo (em bytes) do arquivo CSV/JSON enviado.
+BULK_CARD_MAX_FILE_BYTES = int(os.getenv("BULK_CARD_MAX_FILE_BYTES", str(1024 * 1024)))
+# Quantidade de cards criados em paralelo (o agendador do Notion continua limitando a taxa).
+BULK_CARD_CONCURRENCY = int(os.getenv("BULK_CARD_CONCURRENCY", "3"))
+# Intervalo mínimo (em segundos) entre atualizações da mensagem de progresso.
+BULK_PROGRESS_INTERVAL = float(os.getenv("BULK_PROGRESS_INTERVAL", "2"))
+
+# (número da linha, mensagem de erro)
+RowError = Tuple[int, str]
+ProgressCallback = Callable[[int, int, int], Awaitable[None]]
+
+
+def parse_bulk_file(filename: str, data: bytes) -> List[Dict[str, str]]:
+    """Lê um arquivo CSV (separado por vírgula, ponto e vírgula ou tab) ou JSON (lista de objetos)."""
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValueError("O arquivo precisa estar codificado em UTF-8.")
+
+    if filename.lower().endswith('.json'):
+        try:
+            rows = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON inválido: {e}")
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("O JSON deve ser uma lista de objetos, um por card.")
+        return [{str(key): value for key, value in row.items()} for row in rows]
+
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(text), dialect=dialect)
+    if not reader.fieldnames:
+        raise ValueError("O CSV precisa ter uma linha de cabeçalho com os nomes das propriedades.")
+    return [row for row in reader if any((value or '').strip() for value in row.values() if isinstance(value, str))]
+
+
+def rows_from_messages(messages: List[discord.Message], title_prop_name: str) -> List[Dict[str, str]]:
+    """
+    Converte mensagens de um tópico em linhas: a primeira linha da mensagem vira o título,
+    e as linhas seguintes no formato 'Propriedade: valor' preenchem as demais propriedades.
+    """
+    rows = []
+    for message in messages:
+        lines = [line.strip() for line in message.clean_content.splitlines() if line.strip()]
+        if message.author.bot or not lines:
+            continue
+        row = {title_prop_name: lines[0]}
+        for line in lines[1:]:
+            key, separator, value = line.partition(':')
+            if separator and key.strip() and value.strip():
+                row[key.strip()] = value.strip()
+        rows.append(row)
+    return rows
+
+
+def map_columns(rows: List[Dict[str, str]], allowed_properties: List[Dict]) -> Tuple[List[Dict[str, str]], List[str]]:
+    """
+    Associa as colunas às propriedades permitidas (sem diferenciar maiúsculas) e
+    retorna as linhas com os nomes reais das propriedades e as colunas ignoradas.
+    """
+    by_folded_name = {prop['name'].casefold(): prop['name'] for prop in allowed_properties}
+    mapped_rows, ignored = [], []
+    for row in rows:
+        mapped = {}
+        for column, value in row.items():
+            prop_name = by_folded_name.get((column or '').strip().casefold())
+            if prop_name is None:
+                if column and column not in ignored:
+                    ignored.append(column)
+                continue
+            if value not in (None, ''):
+                mapped[prop_name] = value
+        mapped_rows.append(mapped)
+    return mapped_rows, ignored
+
+
+def _validate_row(row: Dict, page_properties: Dict, properties_by_name: Dict[str, Dict], title_prop_name: str) -> Optional[str]:
+    """Confere o resultado do build_page_properties: valores informados que não viraram propriedade são erros."""
+    if not str(row.get(title_prop_name, '')).strip():
+        return f"o título ('{title_prop_name}') está vazio"
+    for prop_name, value in row.items():
+        if prop_name == title_prop_name:
+            continue
+        prop = properties_by_name[prop_name]
+        if prop_name not in page_properties:
+            return f"valor inválido para '{prop_name}': {value}"
+        # Status não aceita opções novas pela API
+        if prop['type'] == 'status' and prop.get('options') and str(value) not in prop['options']:
+            return f"'{value}' não é uma opção de '{prop_name}'"
+    return None
+
+
+async def create_cards_in_bulk(notion: NotionIntegration, config: dict, rows: List[Dict], all_properties: List[Dict],
+                               fixed_properties: Optional[Dict] = None, on_progress: Optional[ProgressCallback] = None,
+                               on_created: Optional[Callable[[Dict], None]] = None) -> Tuple[List[Tuple[int, Dict]], List[RowError]]:
+    """
+    Valida todas as linhas contra um único schema (buscado uma vez e mantido em cache)
+    e cria as páginas com um conjunto limitado de tarefas em paralelo. As linhas são
+    numeradas a partir de 1. Retorna (cards criados, erros por linha).
+    """
+    db_url = config['notion_url']
+    title_prop_name = next(prop['name'] for prop in all_properties if prop['type'] == 'title')
+    properties_by_name = {prop['name']: prop for prop in all_properties}
+    await notion.get_database_properties(db_url)
+
+    # 1. Validação: monta as propriedades de todas as linhas antes de criar qualquer página
+    payloads, errors = [], []
+    for row_number, row in enumerate(rows, start=1):
+        try:
+            page_properties = await notion.build_page_properties(db_url, row.get(title_prop_name, ''), {
+                **{name: value for name, value in row.items() if name != title_prop_name},
+                **(fixed_properties or {}),
+            })
+        except NotionAPIError as e:
+            errors.append((row_number, str(e)))
+            continue
+        error = _validate_row(row, page_properties, properties_by_name, title_prop_name)
+        if error:
+            errors.append((row_number, error))
+        else:
+            payloads.append((row_number, page_properties))
+
+    # 2. Criação: tarefas consumindo uma fila; a taxa real é controlada pelo agendador do Notion
+    created: List[Tuple[int, Dict]] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in payloads:
+        queue.put_nowait(item)
+    total = len(payloads)
+
+    async def worker():
+        while True:
+            try:
+                row_number, page_properties = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                page = await notion.insert_into_database(db_url, page_properties)
+                created.append((row_number, page))
+                if on_created:
+                    on_created(page)
+            except NotionAPIError as e:
+                errors.append((row_number, str(e)))
+            if on_progress:
+                await on_progress(len(created), len(errors), total)
+
+    # As criações em massa cedem a vez aos comandos interativos (/busca, /card) na fila do Notion;
+    # as tarefas criadas dentro do bloco herdam a prioridade
+    with background_priority():
+        await asyncio.gather(*(worker() for _ in range(max(1, min(BULK_CARD_CONCURRENCY, total)))))
+    created.sort(key=lambda item: item[0])
+    errors.sort(key=lambda item: item[0])
+    return created, errors
+
+
+def throttled_progress(message: discord.Message, interval: float = BULK_PROGRESS_INTERVAL) -> ProgressCallback:
+    """Callback de progresso que edita a mensagem no máximo uma vez a cada `interval` segundos."""
+    last_update = 0.0
+
+    async def update(created_count: int, error_count: int, total: int):
+        nonlocal last_update
+        now = time.monotonic()
+        if now - last_update < interval:
+            return
+        last_update = now
+        try:
+            await message.edit(content=f"⚙️ Criando cards... {created_count}/{total} criados, {error_count} erro(s).")
+        except discord.HTTPException:
+            pass
+
+    return update
+
+
+def build_error_report(errors: List[RowError]) -> discord.File:
+    """Relatório CSV com os erros por linha, enviado como anexo."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["linha", "erro"])
+    writer.writerows(errors)
+    return discord.File(io.BytesIO(buffer.getvalue().encode('utf-8-sig')), filename="card_bulk_erros.csv")
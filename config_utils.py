@@ -1,38 +1,307 @@
 # config_utils.py
 
+import atexit
+import copy
 import json
-from typing import Optional, Dict, Any
+import os
+import sqlite3
+import threading
+import time
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Mapping, Tuple
+
+from atomic_files import DebouncedJsonWriter
 
 CONFIG_FILE_PATH = 'configs.json'
+# Janela (em segundos) para agrupar várias gravações seguidas em uma única escrita no disco.
+WRITE_DEBOUNCE_SECONDS = float(os.getenv("CONFIG_WRITE_DEBOUNCE", "0.5"))
+# Intervalo mínimo (em segundos) entre verificações de edições externas no arquivo.
+WATCH_INTERVAL_SECONDS = float(os.getenv("CONFIG_WATCH_INTERVAL", "2"))
+# Backend de armazenamento: 'json' (padrão) ou 'sqlite'.
+CONFIG_BACKEND = os.getenv("CONFIG_BACKEND", "json").lower()
+CONFIG_DB_PATH = os.getenv("CONFIG_DB_PATH", "configs.db")
+# No SQLite, as configurações do servidor ficam na linha com channel_id vazio.
+GUILD_ROW_CHANNEL_ID = ''
+
+
+def _merge_effective(guild_defaults: Dict[str, Any], channel_config: Optional[Dict[str, Any]]) -> Optional[Mapping[str, Any]]:
+    """Mescla os padrões do servidor com a configuração do canal em um mapeamento somente leitura."""
+    if channel_config is None and not guild_defaults:
+        return None
+    # Valores definidos no canal (inclusive None) têm precedência sobre os do servidor
+    return MappingProxyType({**guild_defaults, **(channel_config or {})})
+
+
+class ConfigStore:
+    """
+    Mantém o `configs.json` em memória: leituras são servidas do dicionário,
+    gravações são agrupadas (debounce) e escritas de forma atômica (arquivo
+    temporário + rename), e edições externas no arquivo são detectadas pelo mtime.
+
+    As chaves gravadas no nível do servidor (ao lado de `channels`) funcionam como
+    padrões herdados por todos os canais. A configuração efetiva (servidor + canal)
+    é pré-calculada e memorizada por (servidor, canal) até que um dos níveis mude.
+    """
+
+    def __init__(self, path: str, debounce_seconds: float = WRITE_DEBOUNCE_SECONDS, watch_interval: float = WATCH_INTERVAL_SECONDS):
+        self.path = path
+        self.debounce_seconds = debounce_seconds
+        self.watch_interval = watch_interval
+        self._lock = threading.RLock()
+        self._configs: Dict[str, Any] = {}
+        self._loaded = False
+        self._file_mtime: Optional[int] = None
+        self._last_watch_check = 0.0
+        self._writer = DebouncedJsonWriter(path, self._snapshot, debounce_seconds, prefix='.configs-', fsync=True,
+                                           on_written=self._record_written_mtime, indent=4)
+        # Memo da configuração efetiva: (server_id, channel_id) -> config somente leitura (ou None)
+        self._effective: Dict[Tuple[str, str], Optional[Mapping[str, Any]]] = {}
+
+    def _stat_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load_from_disk(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._configs = json.load(f)
+        except FileNotFoundError:
+            self._configs = {}
+        except json.JSONDecodeError as e:
+            # Mantém o que já estava em memória se o arquivo estiver sendo editado/corrompido
+            print(f"Aviso: não foi possível ler '{self.path}': {e}")
+            if not self._loaded:
+                self._configs = {}
+        self._file_mtime = self._stat_mtime()
+        self._loaded = True
+        self._effective.clear()
+
+    def _ensure_fresh(self):
+        """Carrega o arquivo na primeira leitura e recarrega se ele foi editado externamente."""
+        if not self._loaded:
+            self._load_from_disk()
+            return
+        now = time.monotonic()
+        if now - self._last_watch_check < self.watch_interval:
+            return
+        self._last_watch_check = now
+        # Com gravações pendentes o estado em memória é o mais recente e prevalece
+        if not self._writer.pending and self._stat_mtime() != self._file_mtime:
+            print(f"'{self.path}' foi alterado externamente. Recarregando configurações.")
+            self._load_from_disk()
+
+    def _snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return copy.deepcopy(self._configs)
+
+    def _record_written_mtime(self):
+        with self._lock:
+            self._file_mtime = self._stat_mtime()
+
+    def _schedule_flush(self):
+        self._writer.schedule()
+
+    def flush(self):
+        """Grava imediatamente as alterações pendentes no disco (escrita atômica)."""
+        self._writer.flush()
+
+    def _build_effective(self, server_id: str, channel_id: str) -> Optional[Mapping[str, Any]]:
+        server_config = self._configs.get(server_id, {})
+        guild_defaults = {key: value for key, value in server_config.items() if key != "channels"}
+        channel_config = server_config.get("channels", {}).get(channel_id)
+        return _merge_effective(guild_defaults, channel_config)
+
+    def get_effective(self, server_id: str, channel_id: str) -> Optional[Mapping[str, Any]]:
+        """Retorna a configuração efetiva (padrões do servidor + canal), somente leitura."""
+        key = (str(server_id), str(channel_id))
+        with self._lock:
+            self._ensure_fresh()
+            if key not in self._effective:
+                self._effective[key] = self._build_effective(*key)
+            return self._effective[key]
+
+    def get_guild(self, server_id: str) -> Dict[str, Any]:
+        with self._lock:
+            self._ensure_fresh()
+            server_config = self._configs.get(str(server_id), {})
+            return {key: value for key, value in server_config.items() if key != "channels"}
+
+    def update_channel(self, server_id: str, channel_id: str, new_channel_config: Dict[str, Any]):
+        with self._lock:
+            self._ensure_fresh()
+            server_config = self._configs.setdefault(str(server_id), {})
+            channel_config = server_config.setdefault("channels", {}).setdefault(str(channel_id), {})
+            channel_config.update(new_channel_config)
+            self._effective.pop((str(server_id), str(channel_id)), None)
+            self._schedule_flush()
+
+    def update_guild(self, server_id: str, new_guild_config: Dict[str, Any]):
+        server_id = str(server_id)
+        if "channels" in new_guild_config:
+            raise ValueError("Use update_channel para alterar configurações de canais.")
+        with self._lock:
+            self._ensure_fresh()
+            self._configs.setdefault(server_id, {}).update(new_guild_config)
+            # Os padrões do servidor afetam todos os seus canais
+            for key in [key for key in self._effective if key[0] == server_id]:
+                del self._effective[key]
+            self._schedule_flush()
+
+
+class SqliteConfigStore:
+    """
+    Implementação da mesma API do `ConfigStore` sobre SQLite (modo WAL): uma linha
+    por servidor/canal com as configurações em uma coluna JSON. Atualizar um canal
+    grava apenas a sua linha, e vários processos podem compartilhar o mesmo banco.
+    Alterações feitas por outros processos são detectadas via `PRAGMA data_version`.
+    """
+
+    def __init__(self, db_path: str, json_path: Optional[str] = None):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._effective: Dict[Tuple[str, str], Optional[Mapping[str, Any]]] = {}
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS channel_configs ("
+            " guild_id TEXT NOT NULL,"
+            " channel_id TEXT NOT NULL,"
+            " settings TEXT NOT NULL,"
+            " PRIMARY KEY (guild_id, channel_id))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        if json_path:
+            self.migrate_from_json(json_path)
+        self._data_version = self._read_data_version()
+
+    def _read_data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _ensure_fresh(self):
+        # data_version muda quando outra conexão confirma uma transação no banco
+        data_version = self._read_data_version()
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self._effective.clear()
+
+    def _read_row(self, guild_id: str, channel_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT settings FROM channel_configs WHERE guild_id = ? AND channel_id = ?", (guild_id, channel_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _merge_row(self, guild_id: str, channel_id: str, new_settings: Dict[str, Any]):
+        """Lê, mescla e grava uma linha em uma transação exclusiva de escrita."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            settings = self._read_row(guild_id, channel_id) or {}
+            settings.update(new_settings)
+            self._conn.execute(
+                "INSERT INTO channel_configs (guild_id, channel_id, settings) VALUES (?, ?, ?) "
+                "ON CONFLICT (guild_id, channel_id) DO UPDATE SET settings = excluded.settings",
+                (guild_id, channel_id, json.dumps(settings)),
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def migrate_from_json(self, json_path: str):
+        """Importa uma única vez o conteúdo de um `configs.json` para o banco."""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+                return
+            try:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    configs = json.load(f)
+            except FileNotFoundError:
+                configs = {}
+
+            rows = []
+            for guild_id, server_config in configs.items():
+                guild_defaults = {key: value for key, value in server_config.items() if key != "channels"}
+                if guild_defaults:
+                    rows.append((str(guild_id), GUILD_ROW_CHANNEL_ID, json.dumps(guild_defaults)))
+                for channel_id, channel_config in server_config.get("channels", {}).items():
+                    rows.append((str(guild_id), str(channel_id), json.dumps(channel_config)))
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # INSERT OR IGNORE: se outro processo já migrou, os dados dele prevalecem
+                self._conn.executemany("INSERT OR IGNORE INTO channel_configs (guild_id, channel_id, settings) VALUES (?, ?, ?)", rows)
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_json', ?)", (json_path,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if rows:
+                print(f"{len(rows)} configuração(ões) migrada(s) de '{json_path}' para '{self.db_path}'.")
+
+    def get_effective(self, server_id: str, channel_id: str) -> Optional[Mapping[str, Any]]:
+        """Retorna a configuração efetiva (padrões do servidor + canal), somente leitura."""
+        key = (str(server_id), str(channel_id))
+        with self._lock:
+            self._ensure_fresh()
+            if key not in self._effective:
+                guild_defaults = self._read_row(key[0], GUILD_ROW_CHANNEL_ID) or {}
+                self._effective[key] = _merge_effective(guild_defaults, self._read_row(*key))
+            return self._effective[key]
+
+    def get_guild(self, server_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return self._read_row(str(server_id), GUILD_ROW_CHANNEL_ID) or {}
+
+    def update_channel(self, server_id: str, channel_id: str, new_channel_config: Dict[str, Any]):
+        with self._lock:
+            self._merge_row(str(server_id), str(channel_id), new_channel_config)
+            self._effective.pop((str(server_id), str(channel_id)), None)
+            self._data_version = self._read_data_version()
+
+    def update_guild(self, server_id: str, new_guild_config: Dict[str, Any]):
+        server_id = str(server_id)
+        if "channels" in new_guild_config:
+            raise ValueError("Use update_channel para alterar configurações de canais.")
+        with self._lock:
+            self._merge_row(server_id, GUILD_ROW_CHANNEL_ID, new_guild_config)
+            for key in [key for key in self._effective if key[0] == server_id]:
+                del self._effective[key]
+            self._data_version = self._read_data_version()
+
+    def flush(self):
+        """Cada gravação já é confirmada na hora; mantido para compatibilidade com o ConfigStore."""
+        pass
+
+
+if CONFIG_BACKEND == "sqlite":
+    _store = SqliteConfigStore(CONFIG_DB_PATH, json_path=CONFIG_FILE_PATH)
+else:
+    _store = ConfigStore(CONFIG_FILE_PATH)
+# Garante que gravações ainda no debounce cheguem ao disco ao encerrar o processo
+atexit.register(_store.flush)
+
 
 def save_config(server_id: str, channel_id: str, new_channel_config: Dict[str, Any]):
     """Salva a configuração de um canal específico no arquivo JSON."""
-    try:
-        with open(CONFIG_FILE_PATH, 'r', encoding='utf-8') as f:
-            configs = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        configs = {}
-
-    server_id_str = str(server_id)
-    channel_id_str = str(channel_id)
-
-    server_config = configs.get(server_id_str, {})
-    if 'channels' not in server_config:
-        server_config['channels'] = {}
-
-    channel_config = server_config["channels"].get(channel_id_str, {})
-    channel_config.update(new_channel_config)
-    server_config["channels"][channel_id_str] = channel_config
-    configs[server_id_str] = server_config
-
-    with open(CONFIG_FILE_PATH, 'w', encoding='utf-8') as f:
-        json.dump(configs, f, indent=4)
-
-def load_config(server_id: str, channel_id: str) -> Optional[Dict[str, Any]]:
-    """Carrega a configuração de um canal específico do arquivo JSON."""
-    try:
-        with open(CONFIG_FILE_PATH, 'r', encoding='utf-8') as f:
-            configs = json.load(f)
-        return configs.get(str(server_id), {}).get("channels", {}).get(str(channel_id))
-    except FileNotFoundError:
-        return None
\ No newline at end of file
+    _store.update_channel(server_id, channel_id, new_channel_config)
+
+def load_config(server_id: str, channel_id: str) -> Optional[Mapping[str, Any]]:
+    """
+    Carrega a configuração efetiva de um canal: os padrões do servidor mesclados
+    com as configurações do próprio canal. O resultado é somente leitura.
+    """
+    return _store.get_effective(server_id, channel_id)
+
+def save_guild_config(server_id: str, new_guild_config: Dict[str, Any]):
+    """Salva configurações padrão do servidor, herdadas por todos os canais."""
+    _store.update_guild(server_id, new_guild_config)
+
+def load_guild_config(server_id: str) -> Dict[str, Any]:
+    """Carrega apenas as configurações padrão do servidor."""
+    return _store.get_guild(server_id)
+
+def flush_config():
+    """Força a gravação imediata das configurações pendentes."""
+    _store.flush()
@@ -1,10 +1,23 @@
 # ia_processor.py
 
 import os
+import asyncio
+import contextlib
+import contextvars
+import random
+import time
 import google.generativeai as genai
-from typing import List
+from typing import List, Optional
 import discord
 
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:
+    google_exceptions = None
+
+from summary_cache import SummaryCache, ThreadSummaryStore
+from thread_snapshot import ThreadSnapshot
+
 # Configura a API do Google com a chave do ambiente
 try:
     genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
@@ -12,31 +25,35 @@ except TypeError:
     print("AVISO: Chave da API do Google não encontrada. A funcionalidade de IA estará desativada.")
     genai = None
 
-def _format_conversation(messages: List[discord.Message]) -> str:
-    """Formata uma lista de mensagens do Discord em um texto único e legível."""
-    conversation_text = ""
-    for msg in reversed(messages): # As mensagens vêm da mais nova para a mais antiga
-        if not msg.author.bot: # Ignora mensagens de bots
-            conversation_text += f"{msg.author.display_name}: {msg.clean_content}\n"
-    return conversation_text
+MODEL_NAME = 'gemini-1.5-flash-latest'
+# Versão dos prompts abaixo; altere ao mudá-los para não reaproveitar resumos antigos do cache.
+PROMPT_VERSION = "1"
 
-async def summarize_thread_content(messages: List[discord.Message]) -> str:
-    """
-    Usa a API do Gemini para resumir uma conversa de um tópico do Discord.
-    """
-    if not genai:
-        return "Erro: A funcionalidade de IA não está configurada (API Key ausente)."
+summary_cache = SummaryCache()
+thread_summary_store = ThreadSummaryStore()
 
-    conversation = _format_conversation(messages)
-    if not conversation.strip():
-        return "" # Retorna vazio se não houver mensagens de usuários
+# Orçamento aproximado de tokens por trecho da conversa enviado ao modelo.
+CHUNK_TOKEN_BUDGET = int(os.getenv("IA_CHUNK_TOKEN_BUDGET", "8000"))
+# Quantidade máxima de trechos resumidos em paralelo.
+MAX_CONCURRENT_CHUNKS = int(os.getenv("IA_MAX_CONCURRENT_CHUNKS", "4"))
+# Aproximação usada para estimar tokens a partir da quantidade de caracteres.
+CHARS_PER_TOKEN = 4
+# Limite de níveis de redução, para conversas gigantescas não recursarem indefinidamente.
+MAX_REDUCE_DEPTH = 3
 
-    # Modelo de IA configurado para ser eficiente e de alta qualidade
-    model = genai.GenerativeModel('gemini-1.5-flash-latest')
+# Backend usado para gerar os resumos: 'gemini' (padrão) ou 'stub' (local, sem chamadas externas).
+IA_BACKEND = os.getenv("IA_BACKEND", "gemini").lower()
+# Máximo de chamadas simultâneas ao modelo em todo o processo.
+IA_MAX_IN_FLIGHT = int(os.getenv("IA_MAX_IN_FLIGHT", "4"))
+# Tempo máximo (em segundos) de cada chamada ao modelo. Dentro de um `summary_deadline`
+# (ex.: criação de card), cada tentativa é limitada também pelo tempo que resta do prazo.
+IA_REQUEST_TIMEOUT = float(os.getenv("IA_REQUEST_TIMEOUT", "20"))
+# Quantas vezes uma chamada que falhou por erro transitório é repetida (enquanto houver prazo).
+IA_MAX_RETRIES = int(os.getenv("IA_MAX_RETRIES", "2"))
+# Espera base (em segundos) do backoff exponencial entre tentativas.
+IA_RETRY_BASE_DELAY = float(os.getenv("IA_RETRY_BASE_DELAY", "1.0"))
 
-    # O prompt é a instrução que damos para a IA. É a parte mais importante.
-    # REVERTIDO PARA O PROMPT ORIGINAL
-    prompt = f"""
+SUMMARY_PROMPT = """
     Você é um assistente especialista em resumir discussões de equipes.
     Sua tarefa é ler a transcrição de uma conversa de um tópico do Discord e criar um resumo conciso e informativo em português.
 
@@ -55,9 +72,314 @@ async def summarize_thread_content(messages: List[discord.Message]) -> str:
     Por favor, gere o resumo.
     """
 
+CHUNK_PROMPT = """
+    Você é um assistente especialista em resumir discussões de equipes.
+    Abaixo está o trecho {index} de {total} da transcrição de uma conversa de um tópico do Discord.
+    Resuma este trecho em português, preservando decisões, ações sugeridas, nomes relevantes e links compartilhados.
+    Não escreva introduções nem conclusões: estas notas serão combinadas com as dos outros trechos.
+
+    Trecho da conversa:
+    ---
+    {conversation}
+    ---
+    """
+
+REDUCE_PROMPT = """
+    Você é um assistente especialista em resumir discussões de equipes.
+    A conversa de um tópico do Discord foi dividida em partes, e cada parte já foi resumida.
+    Combine os resumos parciais abaixo em um único resumo conciso e informativo em português.
+
+    O resumo deve:
+    1.  Ser escrito em da melhor forma para organização.
+    2.  Identificar a ideia principal ou o problema discutido.
+    3.  Listar os principais pontos, decisões tomadas ou ações sugeridas.
+    4.  Incluir quaisquer links importantes que foram compartilhados na conversa.
+    5.  Ser objetivo e direto.
+
+    Resumos parciais, em ordem cronológica:
+    ---
+    {conversation}
+    ---
+
+    Por favor, gere o resumo.
+    """
+
+
+INCREMENTAL_PROMPT = """
+    Você é um assistente especialista em resumir discussões de equipes.
+    Abaixo está o resumo atual de um tópico do Discord e as mensagens enviadas depois que ele foi escrito.
+    Atualize o resumo em português incorporando as novas mensagens: mantenha o que continua válido,
+    acrescente novos pontos, decisões, ações e links, e corrija o que as novas mensagens tornaram obsoleto.
+
+    O resumo deve:
+    1.  Ser escrito em da melhor forma para organização.
+    2.  Identificar a ideia principal ou o problema discutido.
+    3.  Listar os principais pontos, decisões tomadas ou ações sugeridas.
+    4.  Incluir quaisquer links importantes que foram compartilhados na conversa.
+    5.  Ser objetivo e direto.
+
+    Resumo atual:
+    ---
+    {previous_summary}
+    ---
+
+    Novas mensagens:
+    ---
+    {conversation}
+    ---
+
+    Por favor, gere o resumo atualizado.
+    """
+
+
+# Erros considerados transitórios: vale a pena tentar de novo depois de uma espera.
+TRANSIENT_ERRORS = (asyncio.TimeoutError, ConnectionError)
+if google_exceptions:
+    TRANSIENT_ERRORS += (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.InternalServerError,
+        google_exceptions.TooManyRequests,
+    )
+
+
+# Instante (time.monotonic) em que o resumo em andamento deve terminar, ou None sem prazo
+_summary_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("summary_deadline", default=None)
+
+
+@contextlib.contextmanager
+def summary_deadline(seconds: Optional[float]):
+    """
+    Define um prazo total para as chamadas ao modelo feitas dentro do bloco (incluindo
+    as várias etapas de um map-reduce). O tempo de cada tentativa e as novas tentativas
+    respeitam o que resta do prazo, em vez de serem cortados por um timeout externo.
+    """
+    token = _summary_deadline.set(time.monotonic() + seconds if seconds is not None else None)
     try:
-        response = await model.generate_content_async(prompt)
+        yield
+    finally:
+        _summary_deadline.reset(token)
+
+
+class GeminiBackend:
+    """Gera texto com o Gemini, reaproveitando a mesma instância do modelo."""
+    name = "gemini"
+
+    def __init__(self, model_name: str = MODEL_NAME):
+        self.model_name = model_name
+        # Modelo de IA configurado para ser eficiente e de alta qualidade
+        self.model = genai.GenerativeModel(model_name) if genai else None
+
+    @property
+    def available(self) -> bool:
+        return self.model is not None
+
+    async def generate(self, prompt: str) -> str:
+        response = await self.model.generate_content_async(prompt)
         return response.text
+
+
+class StubBackend:
+    """Backend local e determinístico, para rodar o bot e testar o fluxo sem acesso à API."""
+    name = "stub"
+    model_name = "stub"
+    available = True
+
+    async def generate(self, prompt: str) -> str:
+        # Devolve o início do último bloco delimitado por '---' (a conversa ou os resumos parciais)
+        sections = prompt.split("---")
+        content = sections[-2].strip() if len(sections) >= 3 else prompt.strip()
+        return f"Resumo (stub): {content[:500]}"
+
+
+class Summarizer:
+    """
+    Serviço de longa duração que faz as chamadas ao modelo: limita quantas chamadas
+    ficam em andamento ao mesmo tempo, aplica um tempo máximo por chamada e repete
+    erros transitórios com backoff exponencial e jitter.
+    """
+
+    def __init__(self, backend, max_in_flight: int = IA_MAX_IN_FLIGHT, timeout: float = IA_REQUEST_TIMEOUT,
+                 max_retries: int = IA_MAX_RETRIES, retry_base_delay: float = IA_RETRY_BASE_DELAY):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    @property
+    def available(self) -> bool:
+        return self.backend.available
+
+    @property
+    def model_name(self) -> str:
+        return self.backend.model_name
+
+    def _remaining(self) -> Optional[float]:
+        deadline = _summary_deadline.get()
+        return None if deadline is None else deadline - time.monotonic()
+
+    async def generate(self, prompt: str) -> str:
+        attempt = 0
+        while True:
+            # A espera por uma vaga também conta no prazo (ex.: rajada de cards criados ao mesmo tempo)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self._remaining())
+            except asyncio.TimeoutError:
+                raise asyncio.TimeoutError("prazo do resumo esgotado aguardando uma vaga na IA")
+            try:
+                remaining = self._remaining()
+                if remaining is not None and remaining <= 0:
+                    raise asyncio.TimeoutError("prazo do resumo esgotado")
+                timeout = self.timeout if remaining is None else min(self.timeout, remaining)
+                try:
+                    return await asyncio.wait_for(self.backend.generate(prompt), timeout=timeout)
+                finally:
+                    self._semaphore.release()
+            except TRANSIENT_ERRORS as e:
+                # A espera acontece fora do semáforo, liberando a vaga para outras chamadas
+                delay = random.uniform(0, self.retry_base_delay * (2 ** attempt))
+                remaining = self._remaining()
+                if attempt >= self.max_retries or (remaining is not None and remaining <= delay):
+                    raise
+                attempt += 1
+                print(f"Aviso: falha transitória na IA ({type(e).__name__}); nova tentativa {attempt}/{self.max_retries} em {delay:.1f}s.")
+                await asyncio.sleep(delay)
+
+
+def _create_summarizer() -> Summarizer:
+    backend = StubBackend() if IA_BACKEND == "stub" else GeminiBackend()
+    return Summarizer(backend)
+
+summarizer = _create_summarizer()
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _format_conversation_lines(messages: List[discord.Message]) -> List[str]:
+    """Formata as mensagens em linhas 'autor: conteúdo', em ordem cronológica."""
+    # As mensagens vêm da mais nova para a mais antiga; ignora mensagens de bots
+    return [f"{msg.author.display_name}: {msg.clean_content}\n" for msg in reversed(messages) if not msg.author.bot]
+
+def _split_into_chunks(lines: List[str], token_budget: int = CHUNK_TOKEN_BUDGET) -> List[str]:
+    """Agrupa as linhas em trechos que respeitam o orçamento de tokens, sem quebrar mensagens quando possível."""
+    max_chars = token_budget * CHARS_PER_TOKEN
+    chunks, current, current_len = [], [], 0
+    for line in lines:
+        # Uma única mensagem maior que o orçamento é quebrada em pedaços
+        pieces = [line[i:i + max_chars] for i in range(0, len(line), max_chars)] or [line]
+        for piece in pieces:
+            if current and current_len + len(piece) > max_chars:
+                chunks.append("".join(current))
+                current, current_len = [], 0
+            current.append(piece)
+            current_len += len(piece)
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+async def _generate(prompt: str) -> str:
+    return await summarizer.generate(prompt)
+
+async def _map_reduce_summary(chunks: List[str], depth: int = 0) -> str:
+    """Resume os trechos em paralelo (com limite de concorrência) e combina os resumos parciais."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHUNKS)
+
+    async def summarize_chunk(index: int, chunk: str) -> str:
+        async with semaphore:
+            return await _generate(CHUNK_PROMPT.format(index=index, total=len(chunks), conversation=chunk))
+
+    partial_summaries = await asyncio.gather(*(summarize_chunk(i, chunk) for i, chunk in enumerate(chunks, start=1)))
+    combined_lines = [f"Parte {i}:\n{summary.strip()}\n\n" for i, summary in enumerate(partial_summaries, start=1)]
+
+    # Se os resumos parciais ainda não couberem em um único prompt, repete a redução em mais um nível
+    reduced_chunks = _split_into_chunks(combined_lines)
+    if len(reduced_chunks) == 1:
+        return await _generate(REDUCE_PROMPT.format(conversation=reduced_chunks[0]))
+    if len(reduced_chunks) < len(chunks) and depth < MAX_REDUCE_DEPTH:
+        return await _map_reduce_summary(reduced_chunks, depth + 1)
+
+    # Sem mais níveis possíveis: combina cada grupo separadamente e junta os resultados,
+    # para que nenhum resumo parcial fique de fora
+    async def reduce_chunk(chunk: str) -> str:
+        async with semaphore:
+            return await _generate(REDUCE_PROMPT.format(conversation=chunk))
+
+    reduced_summaries = await asyncio.gather(*(reduce_chunk(chunk) for chunk in reduced_chunks))
+    return "\n\n".join(summary.strip() for summary in reduced_summaries)
+
+async def _summarize_transcript(lines: List[str]) -> str:
+    """Resume a transcrição em um único prompt ou, se ela não couber, em etapas (map-reduce)."""
+    conversation = "".join(lines)
+    if _estimate_tokens(conversation) <= CHUNK_TOKEN_BUDGET:
+        return await _generate(SUMMARY_PROMPT.format(conversation=conversation))
+    return await _map_reduce_summary(_split_into_chunks(lines))
+
+async def _update_summary(previous_summary: str, lines: List[str]) -> str:
+    """Atualiza um resumo existente com as mensagens novas."""
+    delta_text = "".join(lines)
+    if _estimate_tokens(delta_text) > CHUNK_TOKEN_BUDGET:
+        delta_text = await _map_reduce_summary(_split_into_chunks(lines))
+    return await _generate(INCREMENTAL_PROMPT.format(previous_summary=previous_summary, conversation=delta_text))
+
+async def _cached_summary(cache_text: str, produce) -> str:
+    """Consulta o cache antes de chamar o modelo e guarda o resultado em caso de sucesso."""
+    # Transcrições idênticas (ex.: novas tentativas ou cards duplicados) reaproveitam o resumo
+    cache_key = summary_cache.make_key(cache_text, summarizer.model_name, PROMPT_VERSION)
+    cached_summary = summary_cache.get(cache_key)
+    if cached_summary is not None:
+        return cached_summary
+
+    summary = await produce()
+
+    if summary:
+        try:
+            summary_cache.put(cache_key, summary)
+        except OSError as e:
+            print(f"Aviso: não foi possível salvar o resumo no cache: {e}")
+    return summary
+
+async def summarize_thread_snapshot(snapshot: ThreadSnapshot) -> str:
+    """
+    Resume um tópico de forma incremental. Se o tópico já foi resumido antes, usa o
+    resumo anterior e apenas as mensagens depois da última mensagem coberta por ele,
+    de modo que o custo acompanha o volume de mensagens novas, não o tamanho do tópico.
+    """
+    if not summarizer.available:
+        return "Erro: A funcionalidade de IA não está configurada (API Key ausente)."
+    if not snapshot.messages:
+        return ""
+
+    thread_id = snapshot.thread.id
+    newest_message_id = snapshot.messages[0].id
+    state = thread_summary_store.get(thread_id)
+
+    try:
+        if state and state.get('summary'):
+            previous_summary = state['summary']
+            if state.get('last_message_id', 0) >= newest_message_id:
+                return previous_summary
+            lines = _format_conversation_lines(await snapshot.messages_after(state['last_message_id']))
+            if not "".join(lines).strip():
+                summary = previous_summary # Só houve mensagens de bots desde o último resumo
+            else:
+                cache_text = f"{previous_summary}\0{''.join(lines)}"
+                summary = await _cached_summary(cache_text, lambda: _update_summary(previous_summary, lines))
+        else:
+            lines = _format_conversation_lines(snapshot.messages)
+            conversation = "".join(lines)
+            if not conversation.strip():
+                return "" # Retorna vazio se não houver mensagens de usuários
+            summary = await _cached_summary(conversation, lambda: _summarize_transcript(lines))
     except Exception as e:
         print(f"Erro ao chamar a API do Gemini: {e}")
-        return f"Erro ao gerar o resumo: {e}"
\ No newline at end of file
+        return f"Erro ao gerar o resumo: {e}"
+
+    if summary:
+        try:
+            thread_summary_store.put(thread_id, summary, newest_message_id)
+        except OSError as e:
+            print(f"Aviso: não foi possível salvar o estado do resumo do tópico {thread_id}: {e}")
+    return summary
@@ -1,59 +1,111 @@
 # notion_integration.py (Versão com correção da busca por 'people' e formatação de IA com parser Markdown)
 
-from notion_client import Client
+from notion_client import AsyncClient, APIResponseError, APIErrorCode
+import asyncio
+import functools
+import httpx
 import os
+import sqlite3
 from dotenv import load_dotenv
 import re
-from datetime import datetime
-from typing import List, Optional, Dict, Any
+import time
+from urllib.parse import unquote
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple
 import discord
 
+from notion_users import NotionUserDirectory
+from notion_scheduler import NotionRequestScheduler, background_priority, default_scheduler
+from search_index import EXACT_PROPERTY_TYPES, SEARCH_INDEX_LIMIT, TEXT_PROPERTY_TYPES, LocalSearchIndex, create_search_index
+from autocomplete_index import MAX_SUGGESTIONS, PrefixIndex, TitleIndex
+from property_codecs import CompiledSchema, extract_value, format_value
+
 load_dotenv()
 
+# Tempo (em segundos) que o schema de uma base de dados fica em cache antes de ser buscado de novo.
+SCHEMA_CACHE_TTL = float(os.getenv("NOTION_SCHEMA_CACHE_TTL", "300"))
+# Tamanho de cada página de `databases.query` (máximo permitido pelo Notion: 100).
+QUERY_PAGE_SIZE = int(os.getenv("NOTION_QUERY_PAGE_SIZE", "100"))
+# Limite padrão de resultados de uma busca (None = sem limite).
+SEARCH_MAX_RESULTS = int(os.getenv("NOTION_SEARCH_MAX_RESULTS", "0")) or None
+# Tempo (em segundos) que a contagem de cards de uma base fica em cache.
+COUNT_CACHE_TTL = float(os.getenv("NOTION_COUNT_CACHE_TTL", "300"))
+# Tempo (em segundos) até o índice de títulos de uma base (autocomplete) ser recarregado.
+TITLE_INDEX_TTL = float(os.getenv("NOTION_TITLE_INDEX_TTL", "600"))
+# Tipos de propriedade pesquisados com `contains` quando a busca é em todas as propriedades.
+TEXT_SEARCH_PROPERTY_TYPES = ['title', 'rich_text', 'url']
+# Tipos de propriedade que podem ser usados para agrupar a contagem de cards.
+GROUPABLE_PROPERTY_TYPES = ['status', 'select', 'multi_select']
+EMPTY_GROUP_LABEL = "(vazio)"
+# Quantidade máxima de blocos aceita pelo Notion em uma única requisição.
+MAX_BLOCKS_PER_REQUEST = 100
+# Conexões HTTP simultâneas com a API do Notion.
+NOTION_MAX_CONNECTIONS = int(os.getenv("NOTION_MAX_CONNECTIONS", "10"))
+# Conexões mantidas abertas (keep-alive) entre requisições.
+NOTION_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("NOTION_MAX_KEEPALIVE_CONNECTIONS", "5"))
+# Tempo (em segundos) que uma conexão ociosa fica aberta esperando reaproveitamento.
+NOTION_KEEPALIVE_EXPIRY = float(os.getenv("NOTION_KEEPALIVE_EXPIRY", "60"))
+# Tempo máximo (em milissegundos) de cada requisição ao Notion.
+NOTION_TIMEOUT_MS = int(os.getenv("NOTION_TIMEOUT_MS", "30000"))
+
 class NotionAPIError(Exception):
     """Exceção customizada para erros da API do Notion."""
     pass
 
+def _create_http_client() -> httpx.AsyncClient:
+    """Cliente HTTP com pool de conexões keep-alive, reaproveitado por todas as chamadas ao Notion."""
+    limits = httpx.Limits(
+        max_connections=NOTION_MAX_CONNECTIONS,
+        max_keepalive_connections=NOTION_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=NOTION_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(limits=limits)
+
 class NotionIntegration:
-    def __init__(self):
+    def __init__(self, scheduler: Optional[NotionRequestScheduler] = None, http_client: Optional[httpx.AsyncClient] = None,
+                 search_index: Optional[LocalSearchIndex] = None):
         self.token = os.getenv("NOTION_TOKEN")
         if not self.token:
             raise ValueError("O token do Notion (NOTION_TOKEN) não foi encontrado no seu ambiente.")
-        self.notion = Client(auth=self.token)
-
-    def _format_property_value(self, prop_type: str, prop_value):
+        # O notion_client aplica o timeout_ms ao cliente HTTP recebido
+        self.notion = AsyncClient(auth=self.token, client=http_client or _create_http_client(), timeout_ms=NOTION_TIMEOUT_MS)
+        # Todas as chamadas à API passam pelo agendador, que respeita o limite de taxa do Notion
+        self.scheduler = scheduler or default_scheduler
+        # Cache de schemas: database_id -> (expira_em, propriedades)
+        self._schema_cache: Dict[str, tuple] = {}
+        self.schema_cache_hits = 0
+        self.schema_cache_misses = 0
+        self.users = NotionUserDirectory(self.notion, self.scheduler)
+        # Cache de contagens: (database_id, propriedade de agrupamento) -> {"expires_at", "total", "groups"}
+        self._count_cache: Dict[tuple, Dict[str, Any]] = {}
+        # Índice local de busca (opcional) e sincronizações completas em andamento por base
+        self.search_index = search_index or create_search_index()
+        self._index_sync_tasks: Dict[str, asyncio.Task] = {}
+        # Índices do autocomplete: títulos por base (database_id -> (carregado_em, TitleIndex))
+        # e opções por propriedade ((database_id, propriedade) -> (schema de origem, PrefixIndex))
+        self._title_indexes: Dict[str, tuple] = {}
+        self._title_index_tasks: Dict[str, asyncio.Task] = {}
+        self._option_indexes: Dict[tuple, tuple] = {}
+
+    async def close(self):
+        """Fecha o pool de conexões HTTP do cliente assíncrono."""
+        await self.notion.aclose()
+
+    async def _request(self, call, *args, **kwargs):
+        """Envia uma chamada à API do Notion pela fila do agendador."""
+        return await self.scheduler.run(call, *args, **kwargs)
+
+    async def _format_property_value(self, prop_type: str, prop_value):
         """Função auxiliar para formatar um valor para a API do Notion."""
-        if prop_type == 'title': return {"title": [{"text": {"content": str(prop_value)}}]}
-        elif prop_type == 'rich_text': return {"rich_text": [{"text": {"content": str(prop_value)}}]}
-        elif prop_type == 'url': return {"url": prop_value}
-        elif prop_type == 'status': return {"status": {"name": str(prop_value)}}
-        elif prop_type == 'select':
-            value = prop_value[0] if isinstance(prop_value, list) else prop_value
-            return {"select": {"name": str(value)}}
-        elif prop_type == 'multi_select':
-            tags_to_add = prop_value if isinstance(prop_value, list) else [tag.strip() for tag in str(prop_value).split(',') if tag.strip()]
-            return {"multi_select": [{"name": tag} for tag in tags_to_add]}
-        elif prop_type == 'date':
-            if not prop_value or not isinstance(prop_value, str): return None
-            date_formats = ["%d/%m/%Y", "%d-%m-%Y", "%d/%m/%y", "%d-%m-%y", "%Y-%m-%d"]
-            date_obj = None
-            for fmt in date_formats:
-                try:
-                    date_obj = datetime.strptime(prop_value, fmt)
-                    break
-                except (ValueError, TypeError): continue
-            if date_obj: return {"date": {"start": date_obj.strftime('%Y-%m-%d')}}
-            else:
-                print(f"Aviso: Não foi possível interpretar a data '{prop_value}'.")
-                return None
-        elif prop_type == 'people':
-            if isinstance(prop_value, list):
-                return {"people": [{"id": user_id} for user_id in prop_value]}
+        if prop_type == 'people' and not isinstance(prop_value, list):
+            # Nomes de pessoas precisam ser resolvidos para IDs antes da formatação
             try:
-                user_id = self.search_id_person(str(prop_value))
-                if user_id: return {"people": [{"id": user_id}]}
-            except NotionAPIError as e: print(f"Aviso: {e}. Propriedade 'people' será ignorada.")
-        return None
+                user_id = await self.search_id_person(str(prop_value))
+            except NotionAPIError as e:
+                print(f"Aviso: {e}. Propriedade 'people' será ignorada.")
+                return None
+            if not user_id: return None
+            prop_value = [user_id]
+        return format_value(prop_type, prop_value)
 
     def _convert_text_to_notion_rich_text_objects(self, text_content: str):
         """
@@ -137,60 +189,402 @@ class NotionIntegration:
         if match: return match.group(1)
         return None
 
-    def search_in_database(self, url, search_term, filter_property, property_type="rich_text"):
+    async def iterate_database(self, url, filter_criteria: Optional[Dict] = None, page_size: int = QUERY_PAGE_SIZE,
+                               max_results: Optional[int] = None, **query_kwargs) -> AsyncIterator[List[Dict]]:
+        """
+        Percorre `databases.query` seguindo o `next_cursor`, produzindo a lista de
+        resultados de cada página assim que ela chega. Para quando não houver mais
+        páginas ou quando `max_results` for atingido.
+        """
+        async for results, _ in self._query_batches(url, filter_criteria, page_size, max_results, **query_kwargs):
+            if results:
+                yield results
+
+    async def _query_batches(self, url, filter_criteria: Optional[Dict], page_size: int, max_results: Optional[int],
+                             **query_kwargs) -> AsyncIterator[Tuple[List[Dict], bool]]:
+        """
+        Igual a `iterate_database`, mas produz (resultados, has_more), com has_more False
+        no último lote, para quem precisa saber que a busca terminou sem pedir outra página.
+        """
         database_id = self.extract_database_id(url)
         if not database_id: raise NotionAPIError("ID da base de dados não encontrado na URL.")
+
+        query = {"database_id": database_id, **query_kwargs}
+        if filter_criteria:
+            query["filter"] = filter_criteria
+        page_size = max(1, min(page_size, 100))
+        fetched = 0
+
+        while True:
+            if max_results is not None:
+                remaining = max_results - fetched
+                if remaining <= 0:
+                    return
+                query["page_size"] = min(page_size, remaining)
+            else:
+                query["page_size"] = page_size
+
+            try:
+                response = await self._request(self.notion.databases.query, **query)
+            except Exception as e:
+                raise NotionAPIError(f"Erro ao buscar no Notion: {e}")
+
+            results = response.get("results", [])
+            fetched += len(results)
+            next_cursor = response.get("next_cursor")
+            has_more = bool(response.get("has_more") and next_cursor) and (max_results is None or fetched < max_results)
+            yield results, has_more
+            if not has_more:
+                return
+            query["start_cursor"] = next_cursor
+
+    async def _build_search_filter(self, url, search_term, filter_property, property_type) -> Optional[Dict]:
+        """
+        Monta o filtro de `databases.query` para a busca. Sem `filter_property`, procura
+        o termo em todas as propriedades de texto. Retorna None se a busca não pode ter resultados.
+        """
+        if filter_property is None:
+            schema = await self.get_database_properties(url)
+            text_filters = [{"property": name, data['type']: {"contains": search_term}}
+                            for name, data in schema.items() if data.get('type') in TEXT_SEARCH_PROPERTY_TYPES]
+            return {"or": text_filters[:100]} if text_filters else None
+
         filter_criteria = {"property": filter_property}
 
         if property_type in ["rich_text", "title"]:
             filter_criteria[property_type] = {"contains": search_term}
         elif property_type in ["status", "select"]:
             filter_criteria[property_type] = {"equals": search_term}
+        elif property_type == "multi_select":
+            filter_criteria["multi_select"] = {"contains": search_term}
         elif property_type == "people":
-            pessoa_id = self.search_id_person(search_term)
-            if pessoa_id:
-                filter_criteria["people"] = {"contains": pessoa_id}
-            else:
-                return {"results": []} # Se não encontrar a pessoa, retorna uma busca vazia para não dar erro
+            pessoa_id = await self.search_id_person(search_term)
+            if not pessoa_id:
+                return None # Se não encontrar a pessoa, a busca é vazia
+            filter_criteria["people"] = {"contains": pessoa_id}
+        return filter_criteria
+
+    async def stream_search(self, url, search_term, filter_property, property_type="rich_text",
+                            page_size: int = QUERY_PAGE_SIZE, max_results: Optional[int] = SEARCH_MAX_RESULTS) -> AsyncIterator[Tuple[List[Dict], bool]]:
+        """
+        Versão em streaming de `search_in_database`: produz (resultados, has_more) página a
+        página, com has_more vindo do próprio Notion, para saber quando a busca terminou.
+        """
+        filter_criteria = await self._build_search_filter(url, search_term, filter_property, property_type)
+        if filter_criteria is None:
+            return
+        async for batch in self._query_batches(url, filter_criteria, page_size, max_results):
+            yield batch
+
+    async def search_in_database(self, url, search_term, filter_property, property_type="rich_text", max_results: Optional[int] = SEARCH_MAX_RESULTS):
+        database_id = self.extract_database_id(url)
+        if not database_id: raise NotionAPIError("ID da base de dados não encontrado na URL.")
+        all_results = []
+        async for results, _ in self.stream_search(url, search_term, filter_property, property_type, max_results=max_results):
+            all_results.extend(results)
+        return {"results": all_results}
+
+    async def index_page(self, page: Optional[Dict]):
+        """
+        Atualiza a página nos índices locais (busca e títulos do autocomplete), sem
+        interromper quem chamou em caso de falha. A escrita no SQLite roda fora do event loop.
+        """
+        if not page:
+            return
+        self._update_title_index(page)
+        if not self.search_index:
+            return
         try:
-            return self.notion.databases.query(database_id=database_id, filter=filter_criteria)
-        except Exception as e:
-            raise NotionAPIError(f"Erro ao buscar no Notion: {e}")
+            await asyncio.to_thread(self.search_index.upsert_page, page, self.extract_value_from_property)
+        except sqlite3.Error as e:
+            print(f"Aviso: não foi possível atualizar o índice local de busca: {e}")
+
+    def _page_title(self, page: Dict) -> str:
+        for prop_data in page.get('properties', {}).values():
+            if prop_data.get('type') == 'title':
+                return self.extract_value_from_property(prop_data, 'title')
+        return ''
+
+    def _update_title_index(self, page: Dict):
+        database_id = ((page.get('parent') or {}).get('database_id') or '').replace('-', '')
+        cached = self._title_indexes.get(database_id)
+        if not cached or not page.get('id'):
+            return
+        title_index = cached[1]
+        if page.get('archived') or page.get('in_trash'):
+            title_index.discard(page['id'])
+        elif 'properties' in page:
+            title_index.set(page['id'], self._page_title(page))
+
+    async def _load_title_index(self, url, database_id: str):
+        """Lê os títulos de todos os cards da base (só a propriedade de título) e monta o índice."""
+        schema = await self.get_database_properties(url)
+        title_ids = [unquote(data['id']) for data in schema.values() if data['type'] == 'title'][:1]
+        titles = {}
+        with background_priority():
+            async for results in self.iterate_database(url, filter_properties=title_ids):
+                for page in results:
+                    titles[page['id']] = self._page_title(page)
+        self._title_indexes[database_id] = (time.monotonic(), TitleIndex(titles))
+
+    def suggest_card_titles(self, url, query: str, limit: int = MAX_SUGGESTIONS) -> List[str]:
+        """
+        Títulos de cards para o autocomplete, servidos da memória. Se o índice da base
+        não existe ou expirou, a carga é disparada em segundo plano e a resposta usa o que houver.
+        """
+        database_id = self.extract_database_id(url)
+        if not database_id:
+            return []
+        cached = self._title_indexes.get(database_id)
+        is_stale = not cached or time.monotonic() - cached[0] > TITLE_INDEX_TTL
+        task = self._title_index_tasks.get(database_id)
+        if is_stale and (task is None or task.done()):
+            async def load():
+                try:
+                    await self._load_title_index(url, database_id)
+                except Exception as e:
+                    print(f"Aviso: falha ao carregar os títulos da base {database_id} para o autocomplete: {e}")
+            self._title_index_tasks[database_id] = asyncio.create_task(load())
+        return cached[1].search(query, limit) if cached else []
+
+    async def suggest_property_options(self, url, prop_name: str, query: str, limit: int = MAX_SUGGESTIONS) -> List[str]:
+        """Opções de uma propriedade status/select/multi_select que casam com o termo, a partir do schema em cache."""
+        database_id = self.extract_database_id(url)
+        if not database_id:
+            return []
+        schema = await self.get_database_properties(url)
+        prop_data = schema.get(prop_name) or {}
+        prop_type = prop_data.get('type')
+        if prop_type not in ['status', 'select', 'multi_select']:
+            return []
+        cache_key = (database_id, prop_name)
+        cached = self._option_indexes.get(cache_key)
+        # O índice é refeito quando o schema em cache é substituído por um novo
+        if not cached or cached[0] is not schema:
+            options = [opt['name'] for opt in prop_data.get(prop_type, {}).get('options', [])]
+            cached = (schema, PrefixIndex(options))
+            self._option_indexes[cache_key] = cached
+        return cached[1].search(query, limit)
+
+    def suggest_people(self, query: str, limit: int = MAX_SUGGESTIONS) -> List[str]:
+        """Nomes de usuários do workspace para o autocomplete, servidos do diretório em memória."""
+        return self.users.suggest(query, limit)
+
+    async def sync_search_index(self, url):
+        """Sincronização completa: lê todas as páginas da base e substitui o conteúdo indexado."""
+        database_id = self.extract_database_id(url)
+        if not self.search_index or not database_id:
+            return
+        pages = []
+        with background_priority():
+            async for results in self.iterate_database(url):
+                pages.extend(results)
+        await asyncio.to_thread(self.search_index.replace_database, database_id, pages, self.extract_value_from_property)
+        print(f"Índice local de busca sincronizado para a base {database_id}: {len(pages)} páginas.")
+
+    def _schedule_index_sync(self, database_id: str, url):
+        task = self._index_sync_tasks.get(database_id)
+        if task and not task.done():
+            return
+
+        async def run_sync():
+            try:
+                await self.sync_search_index(url)
+            except Exception as e:
+                print(f"Aviso: falha ao sincronizar o índice local de busca da base {database_id}: {e}")
+
+        self._index_sync_tasks[database_id] = asyncio.create_task(run_sync())
 
-    def get_database_properties(self, url):
+    async def search_local(self, url, search_term: str, filter_property: Optional[str] = None,
+                           property_type: Optional[str] = None) -> Optional[AsyncIterator[Tuple[List[Dict], bool]]]:
+        """
+        Busca no índice local. Propriedades de texto são buscadas por relevância; opções
+        e pessoas, pelo valor exato, como no filtro `equals`/`contains` do Notion.
+        Retorna um stream de (resultados, has_more) no mesmo formato de `stream_search`,
+        paginado no índice em lotes de SEARCH_INDEX_LIMIT. Retorna None quando a busca
+        precisa ir ao Notion: índice desativado, tipo de propriedade não indexado, base
+        ainda não sincronizada (a sincronização é disparada em segundo plano) ou nenhum
+        resultado local.
+        """
+        database_id = self.extract_database_id(url)
+        if not self.search_index or not database_id:
+            return None
+        exact = filter_property is not None and property_type in EXACT_PROPERTY_TYPES
+        if filter_property is not None and not exact and property_type not in TEXT_PROPERTY_TYPES:
+            return None
+        try:
+            if not await asyncio.to_thread(self.search_index.is_synced, database_id):
+                self._schedule_index_sync(database_id, url)
+                return None
+            if property_type == 'people' and exact:
+                # O Notion filtra pessoas pelo ID do usuário encontrado a partir do nome
+                search_term = await self.search_id_person(search_term)
+                if not search_term:
+                    return None
+                search_term = search_term.replace('-', '')
+            search = functools.partial(self.search_index.search, database_id, search_term, filter_property, exact=exact)
+            # Um resultado a mais que o lote indica se há outra página, sem precisar contar tudo
+            first_batch = await asyncio.to_thread(search, offset=0, limit=SEARCH_INDEX_LIMIT + 1)
+        except (sqlite3.Error, NotionAPIError) as e:
+            print(f"Aviso: falha na busca local; usando o Notion: {e}")
+            return None
+        if not first_batch:
+            return None
+        return self._local_batches(search, first_batch)
+
+    async def _local_batches(self, search, batch: List[Dict]) -> AsyncIterator[Tuple[List[Dict], bool]]:
+        offset = 0
+        while batch:
+            has_more = len(batch) > SEARCH_INDEX_LIMIT
+            yield batch[:SEARCH_INDEX_LIMIT], has_more
+            if not has_more:
+                return
+            offset += SEARCH_INDEX_LIMIT
+            try:
+                batch = await asyncio.to_thread(search, offset=offset, limit=SEARCH_INDEX_LIMIT + 1)
+            except sqlite3.Error as e:
+                print(f"Aviso: falha ao carregar mais resultados da busca local: {e}")
+                return
+
+    async def get_database_properties(self, url):
+        """
+        Retorna o schema (propriedades) da base de dados, servido do cache enquanto
+        o TTL não expirar. Use `invalidate_schema` para forçar uma nova busca.
+        """
         database_id = self.extract_database_id(url)
         if not database_id: raise NotionAPIError("ID da base de dados não encontrado na URL.")
+
+        cached = self._schema_cache.get(database_id)
+        if cached and cached[0] > time.monotonic():
+            self.schema_cache_hits += 1
+            return cached[1]
+
+        self.schema_cache_misses += 1
         try:
-            return self.notion.databases.retrieve(database_id)['properties']
+            properties = (await self._request(self.notion.databases.retrieve, database_id))['properties']
         except Exception as e: raise NotionAPIError(f"Erro ao obter propriedades do Notion: {e}")
+        # O schema é compilado uma vez por busca e fica no cache junto com ele
+        self._schema_cache[database_id] = (time.monotonic() + SCHEMA_CACHE_TTL, properties, CompiledSchema(properties))
+        return properties
+
+    async def get_compiled_schema(self, url) -> CompiledSchema:
+        """Retorna as tabelas de formatadores/extratores por propriedade do schema em cache."""
+        await self.get_database_properties(url)
+        return self._schema_cache[self.extract_database_id(url)][2]
+
+    def _cached_compiled_schema(self, page: Dict) -> Optional[CompiledSchema]:
+        """Schema compilado da base de uma página, se ele já estiver no cache (sem chamar a API)."""
+        database_id = ((page.get('parent') or {}).get('database_id') or '').replace('-', '')
+        cached = self._schema_cache.get(database_id)
+        return cached[2] if cached else None
+
+    def invalidate_schema(self, url: Optional[str] = None):
+        """Remove do cache o schema de uma base de dados (ou de todas, se `url` for None)."""
+        if url is None:
+            self._schema_cache.clear()
+            return
+        database_id = self.extract_database_id(url)
+        if database_id:
+            self._schema_cache.pop(database_id, None)
+
+    def get_schema_cache_stats(self) -> Dict[str, int]:
+        """Retorna os contadores de acerto/erro do cache de schemas."""
+        return {
+            "hits": self.schema_cache_hits,
+            "misses": self.schema_cache_misses,
+            "entries": len(self._schema_cache),
+        }
+
+    def get_scheduler_stats(self) -> Dict[str, Any]:
+        """Retorna as métricas da fila de requisições ao Notion."""
+        return self.scheduler.get_stats()
 
-    def search_id_person(self, search_term: str):
+    async def search_id_person(self, search_term: str):
         if not isinstance(search_term, str) or not search_term:
             return None
         try:
-            users = self.notion.users.list()
-            search_term_lower = search_term.lower()
-            for user in users.get("results", []):
-                user_name = user.get("name")
-                if user_name and search_term_lower in user_name.lower():
-                    return user.get("id")
-                user_email = user.get("person", {}).get("email")
-                if user_email and user_email.lower() == search_term_lower:
-                    return user.get("id")
-            return None
+            return await self.users.resolve(search_term)
         except Exception as e:
             print(f"Erro ao buscar usuários do Notion: {e}")
             raise NotionAPIError(f"Não foi possível buscar os usuários no Notion.")
 
-    def get_database_count(self, url):
+    async def resolve_people(self, names: List[str]) -> List[str]:
+        """Resolve uma lista de nomes para IDs de usuários do Notion, ignorando os não encontrados."""
+        try:
+            resolved = await self.users.resolve_people(names)
+        except Exception as e:
+            print(f"Erro ao buscar usuários do Notion: {e}")
+            raise NotionAPIError(f"Não foi possível buscar os usuários no Notion.")
+        # Remove duplicatas preservando a ordem
+        return list(dict.fromkeys(uid for uid in resolved.values() if uid))
+
+    def _group_values(self, prop_data: Optional[Dict]) -> List[str]:
+        """Retorna os valores de agrupamento (nomes das opções) de uma propriedade de página."""
+        prop_type = prop_data.get('type') if prop_data else None
+        if prop_type == 'multi_select':
+            names = [tag.get('name') for tag in prop_data.get('multi_select') or []]
+        elif prop_type in ['status', 'select']:
+            option = prop_data.get(prop_type)
+            names = [option.get('name')] if option else []
+        else:
+            names = []
+        return [name for name in names if name] or [EMPTY_GROUP_LABEL]
+
+    def _adjust_count_cache(self, page: Dict, delta: int):
+        """Atualiza incrementalmente as contagens em cache quando o bot cria ou arquiva uma página."""
+        database_id = (page.get('parent') or {}).get('database_id', '').replace('-', '')
+        if not database_id:
+            return
+        properties = page.get('properties', {})
+        for (cached_db_id, group_by), entry in self._count_cache.items():
+            if cached_db_id != database_id:
+                continue
+            entry["total"] = max(0, entry["total"] + delta)
+            if group_by:
+                for value in self._group_values(properties.get(group_by)):
+                    new_count = entry["groups"].get(value, 0) + delta
+                    if new_count > 0: entry["groups"][value] = new_count
+                    else: entry["groups"].pop(value, None)
+
+    async def count_database(self, url, group_by: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Conta as páginas da base percorrendo todos os cursores com payload mínimo
+        (`filter_properties`) e, opcionalmente, agrupa por uma propriedade de
+        status/select/multi_select na mesma passada. Retorna {"total": int, "groups": {valor: int}}.
+        """
         database_id = self.extract_database_id(url)
         if not database_id: raise NotionAPIError("ID da base de dados não encontrado na URL.")
-        try:
-            query_result = self.notion.databases.query(database_id)
-            return len(query_result['results'])
-        except Exception as e: raise NotionAPIError(f"Erro ao contar páginas no Notion: {e}")
 
-    def insert_into_database(self, url, properties, children: Optional[List[Dict]] = None):
+        cache_key = (database_id, group_by)
+        cached = self._count_cache.get(cache_key)
+        if cached and cached["expires_at"] > time.monotonic():
+            return {"total": cached["total"], "groups": dict(cached["groups"])}
+
+        schema = await self.get_database_properties(url)
+        if group_by:
+            group_data = schema.get(group_by)
+            if not group_data or group_data.get('type') not in GROUPABLE_PROPERTY_TYPES:
+                raise NotionAPIError(f"A propriedade '{group_by}' não existe ou não é do tipo Status/Select/Multi-select.")
+            wanted_ids = [group_data['id']]
+        else:
+            # Pede apenas o título para reduzir o payload de cada página
+            wanted_ids = [data['id'] for data in schema.values() if data['type'] == 'title'][:1]
+
+        total, groups = 0, {}
+        async for results in self.iterate_database(url, filter_properties=[unquote(prop_id) for prop_id in wanted_ids]):
+            total += len(results)
+            if group_by:
+                for page in results:
+                    for value in self._group_values(page.get('properties', {}).get(group_by)):
+                        groups[value] = groups.get(value, 0) + 1
+
+        self._count_cache[cache_key] = {"expires_at": time.monotonic() + COUNT_CACHE_TTL, "total": total, "groups": groups}
+        return {"total": total, "groups": dict(groups)}
+
+    async def get_database_count(self, url):
+        return (await self.count_database(url))["total"]
+
+    async def insert_into_database(self, url, properties, children: Optional[List[Dict]] = None):
         """
         Cria uma nova página no Notion, com propriedades e, opcionalmente, conteúdo (children).
         """
@@ -202,59 +596,66 @@ class NotionIntegration:
             "parent": {"database_id": database_id},
             "properties": properties
         }
+        # O Notion aceita no máximo 100 blocos na criação; o restante é anexado depois
+        extra_children = []
         if children:
-            payload["children"] = children
+            payload["children"] = children[:MAX_BLOCKS_PER_REQUEST]
+            extra_children = children[MAX_BLOCKS_PER_REQUEST:]
 
         try:
-            return self.notion.pages.create(**payload)
+            response = await self._request(self.notion.pages.create, **payload)
+        except APIResponseError as e:
+            # Um erro de validação normalmente indica que o schema em cache está desatualizado
+            if e.code == APIErrorCode.ValidationError:
+                self.invalidate_schema(url)
+            raise NotionAPIError(f"Erro ao criar a página no Notion: {e}")
         except Exception as e:
             raise NotionAPIError(f"Erro ao criar a página no Notion: {e}")
+        self._adjust_count_cache(response, +1)
+        await self.index_page(response)
+        if extra_children:
+            await self.append_block_children(response['id'], extra_children)
+        return response
+
+    async def append_block_children(self, block_id: str, children: List[Dict]):
+        """Adiciona blocos ao final de uma página (ou bloco), em lotes de até 100 blocos."""
+        try:
+            for start in range(0, len(children), MAX_BLOCKS_PER_REQUEST):
+                await self._request(self.notion.blocks.children.append, block_id=block_id, children=children[start:start + MAX_BLOCKS_PER_REQUEST])
+        except Exception as e:
+            raise NotionAPIError(f"Erro ao adicionar conteúdo à página no Notion: {e}")
 
-    def build_page_properties(self, db_url: str, title: str, properties_dict: dict):
-        schema = self.get_database_properties(db_url)
+    async def build_page_properties(self, db_url: str, title: str, properties_dict: dict):
+        compiled = await self.get_compiled_schema(db_url)
         page_properties = {}
-        title_prop_name = next((name for name, data in schema.items() if data['type'] == 'title'), None)
-        if title_prop_name:
-            page_properties[title_prop_name] = self._format_property_value('title', title)
+        if compiled.title_prop_name:
+            page_properties[compiled.title_prop_name] = compiled.formatters[compiled.title_prop_name](title)
 
         for prop_name, prop_value in properties_dict.items():
-            prop_data = schema.get(prop_name)
-            if not prop_data:
+            formatter = compiled.formatters.get(prop_name)
+            if not formatter:
                 print(f"AVISO: A propriedade '{prop_name}' não foi encontrada na base de dados. Ela será ignorada.")
                 continue
-            formatted_prop = self._format_property_value(prop_data.get('type'), prop_value)
+            if compiled.types[prop_name] == 'people':
+                formatted_prop = await self._format_property_value('people', prop_value)
+            else:
+                formatted_prop = formatter(prop_value)
             if formatted_prop:
                 page_properties[prop_name] = formatted_prop
         return page_properties
 
-    def build_update_payload(self, prop_name: str, prop_type: str, prop_value):
-        formatted_prop = self._format_property_value(prop_type, prop_value)
+    async def build_update_payload(self, prop_name: str, prop_type: str, prop_value):
+        formatted_prop = await self._format_property_value(prop_type, prop_value)
         if formatted_prop:
             return {prop_name: formatted_prop}
         return {}
 
     def extract_value_from_property(self, prop_data, prop_type):
-        try:
-            if prop_type == 'title': return prop_data.get('title', [{}])[0].get('plain_text', '')
-            elif prop_type == 'rich_text': return "".join([part.get('plain_text', '') for part in prop_data.get('rich_text', [])])
-            elif prop_type == 'status': return prop_data.get('status', {}).get('name', '')
-            elif prop_type == 'select': return prop_data.get('select', {}).get('name', '')
-            elif prop_type == 'multi_select': return ", ".join([tag.get('name', '') for tag in prop_data.get('multi_select', [])])
-            elif prop_type == 'people': return ", ".join([person.get('name', 'Usuário Desconhecido') for person in prop_data.get('people', [])])
-            elif prop_type == 'date':
-                date_info = prop_data.get('date')
-                if date_info and date_info.get('start'):
-                    return datetime.fromisoformat(date_info['start']).strftime('%d/%m/%Y')
-                return ''
-            elif prop_type == 'url': return prop_data.get('url', '')
-            elif prop_type == 'number': return str(prop_data.get('number', ''))
-            return ''
-        except (IndexError, TypeError, AttributeError):
-            return ''
-
-
-    def get_properties_for_interaction(self, url):
-        all_props = self.get_database_properties(url)
+        return extract_value(prop_data, prop_type)
+
+
+    async def get_properties_for_interaction(self, url):
+        all_props = await self.get_database_properties(url)
         properties_to_ask, title_prop = [], None
         excluded_types = ['rollup', 'created_by', 'created_time', 'last_edited_by', 'last_edited_time', 'formula']
         for prop_name, prop_data in all_props.items():
@@ -280,12 +681,15 @@ class NotionIntegration:
         page_url, title = page_result.get('url', '#'), "Card sem título"
         fields = []
         props_to_iterate = display_properties if display_properties is not None else list(properties.keys())
+        compiled = self._cached_compiled_schema(page_result)
 
         for prop_name in props_to_iterate:
             prop_data = properties.get(prop_name)
             if not prop_data: continue
             prop_type = prop_data.get('type')
-            value = self.extract_value_from_property(prop_data, prop_type)
+            # Usa o extrator pré-compilado quando o schema em cache confere com o tipo da página
+            extractor = compiled.extractors.get(prop_name) if compiled and compiled.types.get(prop_name) == prop_type else None
+            value = extract_value(prop_data, prop_type, extractor)
             if prop_type == 'title':
                 title = value if value else title
                 continue
@@ -300,19 +704,43 @@ class NotionIntegration:
 
         return embed
 
-    def update_page(self, page_id: str, properties: dict):
+    async def update_page(self, page_id: str, properties: dict):
         try:
-            return self.notion.pages.update(page_id=page_id, properties=properties)
+            response = await self._request(self.notion.pages.update, page_id=page_id, properties=properties)
+        except APIResponseError as e:
+            # Não sabemos a base de dados da página aqui, então descartamos todos os schemas
+            if e.code == APIErrorCode.ValidationError:
+                self.invalidate_schema()
+            raise NotionAPIError(f"Erro ao atualizar a página no Notion: {e}")
         except Exception as e: raise NotionAPIError(f"Erro ao atualizar a página no Notion: {e}")
+        await self.index_page(response)
+        return response
 
-    def get_page(self, page_id: str):
+    async def get_page(self, page_id: str):
         try:
-            return self.notion.pages.retrieve(page_id=page_id)
+            return await self._request(self.notion.pages.retrieve, page_id=page_id)
         except Exception as e: raise NotionAPIError(f"Erro ao buscar a página no Notion: {e}")
 
-    def delete_page(self, page_id: str):
+    async def delete_page(self, page_id: str):
         """Arquiva (deleta) uma página no Notion."""
         try:
-            return self.notion.pages.update(page_id=page_id, archived=True)
+            response = await self._request(self.notion.pages.update, page_id=page_id, archived=True)
         except Exception as e:
             raise NotionAPIError(f"Erro ao deletar (arquivar) a página no Notion: {e}")
+        self._adjust_count_cache(response, -1)
+        await self.index_page(response)
+        return response
+
+
+_shared_integration: Optional[NotionIntegration] = None
+
+def get_notion_integration() -> NotionIntegration:
+    """
+    Retorna a instância de NotionIntegration compartilhada pelo processo (comandos do
+    bot e webhooks), criando-a no primeiro uso. Assim o pool de conexões, os caches de
+    schema/usuários e a fila de requisições são únicos.
+    """
+    global _shared_integration
+    if _shared_integration is None:
+        _shared_integration = NotionIntegration()
+    return _shared_integration
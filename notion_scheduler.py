@@ -0,0 +1,172 @@
+# notion_scheduler.py
+
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import time
+from typing import Any, Dict, Optional
+
+from notion_client import APIResponseError, APIErrorCode
+
+# Requisições por segundo permitidas pelo Notion para cada integração.
+NOTION_RATE_LIMIT = float(os.getenv("NOTION_RATE_LIMIT", "3"))
+# Quantidade de requisições que podem sair de uma vez depois de um período ocioso.
+NOTION_RATE_BURST = int(os.getenv("NOTION_RATE_BURST", "3"))
+# Quantas vezes uma requisição recusada com 429 é repetida antes de desistir.
+NOTION_MAX_RETRIES = int(os.getenv("NOTION_MAX_RETRIES", "5"))
+# Espera (em segundos) usada quando o Notion não informa o cabeçalho Retry-After.
+NOTION_DEFAULT_RETRY_AFTER = float(os.getenv("NOTION_DEFAULT_RETRY_AFTER", "1.0"))
+
+# Faixas de prioridade: valores menores são atendidos primeiro.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+LANE_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+# Prioridade das requisições feitas no contexto atual (herdada pelas tarefas criadas a partir dele).
+_current_priority: contextvars.ContextVar[int] = contextvars.ContextVar("notion_request_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextlib.contextmanager
+def background_priority():
+    """Marca as requisições feitas dentro do bloco (e nas tarefas criadas nele) como de segundo plano."""
+    token = _current_priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def _retry_after_seconds(error: APIResponseError) -> float:
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return NOTION_DEFAULT_RETRY_AFTER
+
+
+class NotionRequestScheduler:
+    """
+    Fila central para as requisições ao Notion.
+
+    Um token bucket limita a taxa de saída; quem espera é atendido por ordem de
+    prioridade (interativas antes das de segundo plano) e, dentro da mesma faixa,
+    por ordem de chegada. Respostas 429 pausam toda a fila pelo tempo indicado no
+    `Retry-After` e a requisição é repetida, de modo que rajadas viram uma pequena
+    espera em vez de erros para o usuário.
+    """
+
+    def __init__(self, rate: float = NOTION_RATE_LIMIT, burst: int = NOTION_RATE_BURST, max_retries: int = NOTION_MAX_RETRIES):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_retries = max_retries
+
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        # Heap de (prioridade, ordem de chegada, future, enfileirada_em)
+        self._waiters: list = []
+        self._sequence = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        self._requests = {lane: 0 for lane in LANE_NAMES.values()}
+        self._total_wait = {lane: 0.0 for lane in LANE_NAMES.values()}
+        self._max_wait = {lane: 0.0 for lane in LANE_NAMES.values()}
+        self._max_queue_depth = 0
+        self._rate_limited = 0
+
+    def _ensure_dispatcher(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Primeiro uso (ou um novo event loop): recomeça a fila neste loop
+            self._loop = loop
+            self._waiters = []
+            self._wakeup = asyncio.Event()
+            self._dispatcher = None
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def _dispatch(self):
+        while True:
+            # Descarta quem desistiu de esperar (tarefa cancelada)
+            while self._waiters and self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+
+            priority, _, future, enqueued_at = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._tokens -= 1
+            lane = LANE_NAMES.get(priority, "background")
+            waited = now - enqueued_at
+            self._requests[lane] += 1
+            self._total_wait[lane] += waited
+            self._max_wait[lane] = max(self._max_wait[lane], waited)
+            future.set_result(None)
+
+    async def _acquire(self, priority: int):
+        self._ensure_dispatcher()
+        future = self._loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future, time.monotonic()))
+        self._max_queue_depth = max(self._max_queue_depth, len(self._waiters))
+        self._wakeup.set()
+        await future
+
+    async def run(self, call, *args, priority: Optional[int] = None, **kwargs) -> Any:
+        """Executa `call(*args, **kwargs)` quando houver vaga no limite de taxa, repetindo em caso de 429."""
+        if priority is None:
+            priority = _current_priority.get()
+        attempt = 0
+        while True:
+            await self._acquire(priority)
+            try:
+                return await call(*args, **kwargs)
+            except APIResponseError as e:
+                if e.code != APIErrorCode.RateLimited or attempt >= self.max_retries:
+                    raise
+                retry_after = _retry_after_seconds(e)
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                self._rate_limited += 1
+                attempt += 1
+                print(f"Aviso: limite de requisições do Notion atingido; nova tentativa {attempt}/{self.max_retries} em {retry_after:.1f}s.")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna as métricas da fila: profundidade atual e máxima, esperas por faixa e quantidade de 429."""
+        pending = [w for w in self._waiters if not w[2].done()]
+        return {
+            "queue_depth": len(pending),
+            "max_queue_depth": self._max_queue_depth,
+            "rate_limited": self._rate_limited,
+            "lanes": {
+                lane: {
+                    "requests": self._requests[lane],
+                    "avg_wait": self._total_wait[lane] / self._requests[lane] if self._requests[lane] else 0.0,
+                    "max_wait": self._max_wait[lane],
+                }
+                for lane in LANE_NAMES.values()
+            },
+        }
+
+
+# O limite do Notion vale por integração, então todas as instâncias compartilham a mesma fila.
+default_scheduler = NotionRequestScheduler()
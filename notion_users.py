@@ -0,0 +1,127 @@
+# notion_users.py
+
+import asyncio
+import bisect
+import functools
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from notion_client import AsyncClient
+from notion_client.helpers import async_iterate_paginated_api
+
+from autocomplete_index import MAX_SUGGESTIONS, PrefixIndex
+from notion_scheduler import NotionRequestScheduler, PRIORITY_BACKGROUND, default_scheduler
+
+# Tempo (em segundos) até o diretório de usuários ser considerado desatualizado.
+USER_DIRECTORY_TTL = float(os.getenv("NOTION_USER_DIRECTORY_TTL", "600"))
+
+
+class NotionUserDirectory:
+    """
+    Diretório em memória dos usuários do workspace do Notion.
+
+    Percorre todas as páginas de `users.list` uma única vez, monta índices por
+    nome e e-mail e se atualiza em segundo plano quando o TTL expira, servindo
+    os dados antigos enquanto a atualização acontece.
+    """
+
+    def __init__(self, client: AsyncClient, scheduler: Optional[NotionRequestScheduler] = None, ttl: float = USER_DIRECTORY_TTL):
+        self._client = client
+        self._scheduler = scheduler or default_scheduler
+        self._ttl = ttl
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+        self._by_email: Dict[str, str] = {}
+        self._by_name: Dict[str, str] = {}
+        # Lista ordenada de (nome em casefold, id) para buscas por prefixo com bisect
+        self._sorted_names: List[Tuple[str, str]] = []
+        # Nomes originais, para as sugestões do autocomplete
+        self._name_index = PrefixIndex()
+
+    async def refresh(self, priority: Optional[int] = None):
+        """Busca todos os usuários (seguindo a paginação) e reconstrói os índices."""
+        by_email, by_name, names, display_names = {}, {}, [], []
+        list_users = functools.partial(self._scheduler.run, self._client.users.list, priority=priority)
+        async for user in async_iterate_paginated_api(list_users, page_size=100):
+            user_id = user.get("id")
+            if not user_id:
+                continue
+            user_name = user.get("name")
+            if user_name:
+                folded = user_name.casefold()
+                # Em caso de nomes repetidos, mantém o primeiro (mesmo comportamento da busca linear)
+                by_name.setdefault(folded, user_id)
+                names.append((folded, user_id))
+                display_names.append(user_name)
+            user_email = (user.get("person") or {}).get("email")
+            if user_email:
+                by_email.setdefault(user_email.casefold(), user_id)
+
+        names.sort()
+        self._by_email, self._by_name, self._sorted_names = by_email, by_name, names
+        self._name_index = PrefixIndex(display_names)
+        self._loaded_at = time.monotonic()
+
+    async def _background_refresh(self):
+        try:
+            async with self._lock:
+                await self.refresh(priority=PRIORITY_BACKGROUND)
+        except Exception as e:
+            print(f"Aviso: falha ao atualizar o diretório de usuários do Notion: {e}")
+
+    async def _ensure_loaded(self):
+        if self._loaded_at is None:
+            async with self._lock:
+                if self._loaded_at is None:
+                    await self.refresh()
+            return
+
+        is_stale = time.monotonic() - self._loaded_at > self._ttl
+        if is_stale and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._background_refresh())
+
+    def _lookup(self, search_term: str) -> Optional[str]:
+        folded = search_term.strip().casefold()
+        if not folded:
+            return None
+
+        if folded in self._by_email:
+            return self._by_email[folded]
+        if folded in self._by_name:
+            return self._by_name[folded]
+
+        # Prefixo: primeiro nome ordenado que começa com o termo
+        index = bisect.bisect_left(self._sorted_names, (folded, ""))
+        if index < len(self._sorted_names) and self._sorted_names[index][0].startswith(folded):
+            return self._sorted_names[index][1]
+
+        # Substring: último recurso, equivalente à busca original
+        for name, user_id in self._sorted_names:
+            if folded in name:
+                return user_id
+        return None
+
+    def suggest(self, search_term: str, limit: int = MAX_SUGGESTIONS) -> List[str]:
+        """
+        Nomes para o autocomplete. Não espera a rede: se o diretório ainda não foi
+        carregado (ou expirou), dispara a atualização em segundo plano e responde com o que tem.
+        """
+        is_stale = self._loaded_at is None or time.monotonic() - self._loaded_at > self._ttl
+        if is_stale and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._background_refresh())
+        return self._name_index.search(search_term, limit)
+
+    async def resolve(self, search_term: str) -> Optional[str]:
+        """Retorna o ID do usuário cujo nome ou e-mail corresponde ao termo."""
+        if not isinstance(search_term, str) or not search_term:
+            return None
+        await self._ensure_loaded()
+        return self._lookup(search_term)
+
+    async def resolve_people(self, names: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Resolve vários nomes de uma vez, retornando um dicionário nome -> ID (ou None)."""
+        await self._ensure_loaded()
+        return {name: self._lookup(name) for name in names if isinstance(name, str) and name}
@@ -0,0 +1,100 @@
+# page_index.py
+
+import atexit
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+import discord
+
+from atomic_files import DebouncedJsonWriter
+
+# Arquivo com o índice página do Notion -> tópico do Discord.
+PAGE_INDEX_PATH = os.getenv("PAGE_INDEX_PATH", "page_index.json")
+# Janela (em segundos) para agrupar várias alterações do índice em uma única escrita no disco.
+PAGE_INDEX_WRITE_DEBOUNCE = float(os.getenv("PAGE_INDEX_WRITE_DEBOUNCE", "2"))
+
+
+def _normalize_page_id(page_id: str) -> str:
+    # O Notion envia IDs com ou sem hífens, dependendo da origem
+    return str(page_id).replace('-', '')
+
+
+class PageIndex:
+    """
+    Índice persistente das páginas criadas pelo bot: para cada página do Notion,
+    guarda o servidor, o canal (chave da configuração) e o tópico de origem, de
+    modo que um webhook descubra o destino com uma consulta local, sem buscar a
+    página inteira nem o canal no Discord.
+
+    Como no `ConfigStore`, as alterações ficam em memória e são agrupadas (debounce)
+    pelo `DebouncedJsonWriter`: a serialização e a escrita no disco rodam em uma
+    thread de timer, sem segurar o lock usado por `get`/`put`.
+    Páginas apagadas ou arquivadas saem do índice (`remove`).
+    """
+
+    def __init__(self, path: str = PAGE_INDEX_PATH, debounce_seconds: float = PAGE_INDEX_WRITE_DEBOUNCE):
+        self.path = path
+        self._lock = threading.RLock()
+        self._entries: Optional[Dict[str, Dict[str, int]]] = None
+        self._writer = DebouncedJsonWriter(path, self._snapshot, debounce_seconds, prefix='.page_index-')
+
+    def _load(self) -> Dict[str, Dict[str, int]]:
+        if self._entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except json.JSONDecodeError as e:
+                print(f"Aviso: não foi possível ler '{self.path}': {e}")
+                self._entries = {}
+        return self._entries
+
+    def _snapshot(self) -> Dict[str, Dict[str, int]]:
+        # Cópia rasa basta: as entradas são substituídas inteiras, nunca alteradas no lugar
+        with self._lock:
+            return dict(self._load())
+
+    def flush(self):
+        """Grava imediatamente as alterações pendentes no disco (escrita atômica)."""
+        self._writer.flush()
+
+    def preload(self):
+        """Lê o arquivo do índice; chamado na inicialização, fora do event loop."""
+        with self._lock:
+            self._load()
+
+    def get(self, page_id: str) -> Optional[Dict[str, int]]:
+        """Retorna {'guild_id', 'channel_id', 'thread_id'} da página, ou None se ela não foi indexada."""
+        with self._lock:
+            return self._load().get(_normalize_page_id(page_id))
+
+    def put(self, page_id: str, guild_id: int, channel_id: int, thread_id: int):
+        entry = {"guild_id": int(guild_id), "channel_id": int(channel_id), "thread_id": int(thread_id)}
+        with self._lock:
+            entries = self._load()
+            if entries.get(_normalize_page_id(page_id)) == entry:
+                return
+            entries[_normalize_page_id(page_id)] = entry
+            self._writer.schedule()
+
+    def remove(self, page_id: str):
+        with self._lock:
+            if self._load().pop(_normalize_page_id(page_id), None) is not None:
+                self._writer.schedule()
+
+
+page_index = PageIndex()
+# Garante que alterações ainda no debounce cheguem ao disco ao encerrar o processo
+atexit.register(page_index.flush)
+
+
+def index_thread_page(page_id: str, thread: discord.Thread):
+    """Registra a página criada a partir de um tópico; a escrita no disco acontece depois, em segundo plano."""
+    guild = getattr(thread, 'guild', None)
+    parent_id = getattr(thread, 'parent_id', None)
+    if not page_id or not guild or not parent_id:
+        return
+    page_index.put(page_id, guild.id, parent_id, thread.id)
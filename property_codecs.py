@@ -0,0 +1,137 @@
+# property_codecs.py
+
+import re
+from datetime import date
+from typing import Any, Callable, Dict, Optional
+
+# Uma única expressão para os formatos de data aceitos: dd/mm/aaaa, dd-mm-aaaa, dd/mm/aa, dd-mm-aa e aaaa-mm-dd.
+DATE_INPUT_PATTERN = re.compile(
+    r"^(?:(?P<day>\d{1,2})(?P<sep>[/-])(?P<month>\d{1,2})(?P=sep)(?P<year>\d{4}|\d{2})"
+    r"|(?P<iso_year>\d{4})-(?P<iso_month>\d{1,2})-(?P<iso_day>\d{1,2}))$"
+)
+# Data ISO no início do campo `start` de uma propriedade de data do Notion.
+ISO_DATE_PATTERN = re.compile(r"^(\d{4})-(\d{2})-(\d{2})")
+
+Formatter = Callable[[Any], Optional[Dict]]
+Extractor = Callable[[Dict], str]
+
+
+def parse_date_input(text: str) -> Optional[str]:
+    """Converte uma data digitada pelo usuário para 'AAAA-MM-DD', ou None se ela for inválida."""
+    match = DATE_INPUT_PATTERN.match(text)
+    if not match:
+        return None
+    if match.group('iso_year'):
+        year, month, day = int(match.group('iso_year')), int(match.group('iso_month')), int(match.group('iso_day'))
+    else:
+        year, month, day = int(match.group('year')), int(match.group('month')), int(match.group('day'))
+        if len(match.group('year')) == 2:
+            # Mesmo pivô do %y: 69-99 -> 1969-1999, 00-68 -> 2000-2068
+            year += 1900 if year >= 69 else 2000
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+# --- FORMATADORES: valor do Discord -> payload da API do Notion ---
+
+def _format_title(value): return {"title": [{"text": {"content": str(value)}}]}
+def _format_rich_text(value): return {"rich_text": [{"text": {"content": str(value)}}]}
+def _format_url(value): return {"url": value}
+def _format_status(value): return {"status": {"name": str(value)}}
+
+def _format_select(value):
+    value = value[0] if isinstance(value, list) else value
+    return {"select": {"name": str(value)}}
+
+def _format_multi_select(value):
+    tags_to_add = value if isinstance(value, list) else [tag.strip() for tag in str(value).split(',') if tag.strip()]
+    return {"multi_select": [{"name": tag} for tag in tags_to_add]}
+
+def _format_date(value):
+    if not value or not isinstance(value, str): return None
+    iso_date = parse_date_input(value)
+    if iso_date: return {"date": {"start": iso_date}}
+    print(f"Aviso: Não foi possível interpretar a data '{value}'.")
+    return None
+
+def _format_people(user_ids):
+    # Recebe IDs já resolvidos; a busca por nome é assíncrona e fica na NotionIntegration
+    return {"people": [{"id": user_id} for user_id in user_ids]}
+
+def _format_unsupported(value): return None
+
+FORMATTERS_BY_TYPE: Dict[str, Formatter] = {
+    'title': _format_title,
+    'rich_text': _format_rich_text,
+    'url': _format_url,
+    'status': _format_status,
+    'select': _format_select,
+    'multi_select': _format_multi_select,
+    'date': _format_date,
+    'people': _format_people,
+}
+
+
+# --- EXTRATORES: propriedade de uma página do Notion -> texto para exibição ---
+
+def _extract_title(prop_data): return prop_data.get('title', [{}])[0].get('plain_text', '')
+def _extract_rich_text(prop_data): return "".join([part.get('plain_text', '') for part in prop_data.get('rich_text', [])])
+def _extract_status(prop_data): return prop_data.get('status', {}).get('name', '')
+def _extract_select(prop_data): return prop_data.get('select', {}).get('name', '')
+def _extract_multi_select(prop_data): return ", ".join([tag.get('name', '') for tag in prop_data.get('multi_select', [])])
+def _extract_people(prop_data): return ", ".join([person.get('name', 'Usuário Desconhecido') for person in prop_data.get('people', [])])
+def _extract_url(prop_data): return prop_data.get('url', '')
+def _extract_number(prop_data): return str(prop_data.get('number', ''))
+
+def _extract_date(prop_data):
+    date_info = prop_data.get('date')
+    if date_info and date_info.get('start'):
+        match = ISO_DATE_PATTERN.match(date_info['start'])
+        if match:
+            return f"{match.group(3)}/{match.group(2)}/{match.group(1)}"
+    return ''
+
+def _extract_unsupported(prop_data): return ''
+
+EXTRACTORS_BY_TYPE: Dict[str, Extractor] = {
+    'title': _extract_title,
+    'rich_text': _extract_rich_text,
+    'status': _extract_status,
+    'select': _extract_select,
+    'multi_select': _extract_multi_select,
+    'people': _extract_people,
+    'date': _extract_date,
+    'url': _extract_url,
+    'number': _extract_number,
+}
+
+
+def format_value(prop_type: str, value) -> Optional[Dict]:
+    return FORMATTERS_BY_TYPE.get(prop_type, _format_unsupported)(value)
+
+
+def extract_value(prop_data: Dict, prop_type: str, extractor: Optional[Extractor] = None) -> str:
+    try:
+        return (extractor or EXTRACTORS_BY_TYPE.get(prop_type, _extract_unsupported))(prop_data)
+    except (IndexError, TypeError, AttributeError):
+        return ''
+
+
+class CompiledSchema:
+    """
+    Schema de uma base "compilado" em tabelas por propriedade (tipo, formatador e
+    extrator), para que formatar um card ou uma página inteira seja só uma consulta
+    ao dicionário por propriedade, sem percorrer cadeias de if/elif pelo tipo.
+    """
+
+    def __init__(self, properties: Dict[str, Dict]):
+        self.types: Dict[str, str] = {name: data.get('type') for name, data in properties.items()}
+        self.title_prop_name: Optional[str] = next((name for name, prop_type in self.types.items() if prop_type == 'title'), None)
+        self.formatters: Dict[str, Formatter] = {
+            name: FORMATTERS_BY_TYPE.get(prop_type, _format_unsupported) for name, prop_type in self.types.items()
+        }
+        self.extractors: Dict[str, Extractor] = {
+            name: EXTRACTORS_BY_TYPE.get(prop_type, _extract_unsupported) for name, prop_type in self.types.items()
+        }
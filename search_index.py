@@ -0,0 +1,245 @@
+# search_index.py
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+# Ativa o índice local de busca (SQLite FTS5) usado pelo /busca.
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "false").lower() in ("1", "true", "yes")
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", "search_index.db")
+# Idade máxima (em segundos) da última sincronização completa de uma base antes de refazê-la.
+SEARCH_INDEX_MAX_AGE = float(os.getenv("SEARCH_INDEX_MAX_AGE", "86400"))
+# Quantidade de resultados de cada lote da busca local (os próximos lotes são lidos sob demanda).
+SEARCH_INDEX_LIMIT = int(os.getenv("SEARCH_INDEX_LIMIT", "100"))
+# Valor da coluna `prop` na linha que reúne o texto de todas as propriedades da página.
+ALL_PROPERTIES = '*'
+# Tipos de propriedade indexados como texto (FTS5); são também os que compõem a linha ALL_PROPERTIES.
+TEXT_PROPERTY_TYPES = ('title', 'rich_text', 'url')
+# Tipos de propriedade com opções fechadas, indexados pelo valor exato (como o `equals`/`contains` do Notion).
+EXACT_PROPERTY_TYPES = ('status', 'select', 'multi_select', 'people')
+# Versão do esquema do arquivo; um arquivo de versão diferente é recriado (o índice é só um cache).
+SCHEMA_VERSION = 2
+
+# Recebe (dados da propriedade, tipo) e devolve o texto pesquisável dela
+TextExtractor = Callable[[Dict, str], str]
+
+
+def _normalize_id(notion_id: str) -> str:
+    return str(notion_id).replace('-', '')
+
+
+def build_match_query(search_term: str) -> Optional[str]:
+    """Converte o termo digitado em uma consulta FTS5: cada palavra vira um prefixo obrigatório."""
+    tokens = re.findall(r"\w+", search_term)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def _exact_values(prop_data: Dict, prop_type: str) -> List[str]:
+    """Valores exatos de uma propriedade de opções: nomes das opções ou IDs das pessoas."""
+    if prop_type in ('status', 'select'):
+        option = prop_data.get(prop_type) or {}
+        return [option['name']] if option.get('name') else []
+    if prop_type == 'multi_select':
+        return [tag['name'] for tag in prop_data.get('multi_select') or [] if tag.get('name')]
+    if prop_type == 'people':
+        return [_normalize_id(person['id']) for person in prop_data.get('people') or [] if person.get('id')]
+    return []
+
+
+class LocalSearchIndex:
+    """
+    Índice das páginas das bases configuradas, guardado em SQLite.
+
+    Propriedades de texto vão para uma tabela FTS5, com uma linha por propriedade
+    (buscas em uma propriedade específica) e uma linha com o texto de todas elas
+    (buscas em qualquer propriedade). Propriedades de opções (status, seleção,
+    pessoas) ficam em `page_values`, comparadas pelo valor exato. A página
+    completa fica em `pages`, pronta para virar embed.
+
+    Os métodos são bloqueantes e devem ser chamados fora do event loop
+    (`asyncio.to_thread`). As escritas usam uma conexão e as leituras outra: com
+    o WAL, uma busca não espera a sincronização completa de uma base terminar.
+    Uma base só é consultada depois de uma sincronização completa; a partir daí
+    é mantida atualizada pelas escritas do próprio bot e pelos webhooks.
+    """
+
+    def __init__(self, db_path: str = SEARCH_INDEX_PATH, max_age: float = SEARCH_INDEX_MAX_AGE):
+        self.db_path = db_path
+        self.max_age = max_age
+        self._write_lock = threading.RLock()
+        self._read_lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            for table in ("page_fts", "fts_rows", "page_values", "pages", "synced_databases"):
+                self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " page_id TEXT PRIMARY KEY,"
+            " database_id TEXT NOT NULL,"
+            " page_json TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_database ON pages (database_id)")
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS page_fts USING fts5("
+            " value, page_id UNINDEXED, database_id UNINDEXED, prop UNINDEXED,"
+            " tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        # Colunas UNINDEXED do FTS5 não podem ser usadas para apagar sem varrer a tabela
+        # inteira; este mapeamento leva da página/base direto aos rowids das linhas FTS.
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fts_rows ("
+            " fts_rowid INTEGER PRIMARY KEY,"
+            " page_id TEXT NOT NULL,"
+            " database_id TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fts_rows_page ON fts_rows (page_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fts_rows_database ON fts_rows (database_id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS page_values ("
+            " page_id TEXT NOT NULL,"
+            " database_id TEXT NOT NULL,"
+            " prop TEXT NOT NULL,"
+            " value TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS page_values_lookup ON page_values (database_id, prop, value)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS page_values_page ON page_values (page_id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS synced_databases (database_id TEXT PRIMARY KEY, synced_at REAL NOT NULL)")
+        self._read_conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+
+    def _insert_page(self, page: Dict, database_id: str, extract_text: TextExtractor):
+        page_id = _normalize_id(page['id'])
+        self._conn.execute(
+            "INSERT INTO pages (page_id, database_id, page_json) VALUES (?, ?, ?)",
+            (page_id, database_id, json.dumps(page)),
+        )
+        fts_rows, exact_rows, all_text = [], [], []
+        for prop_name, prop_data in page.get('properties', {}).items():
+            prop_type = prop_data.get('type')
+            if prop_type in TEXT_PROPERTY_TYPES:
+                text = extract_text(prop_data, prop_type)
+                if text:
+                    fts_rows.append((text, prop_name))
+                    all_text.append(text)
+            elif prop_type in EXACT_PROPERTY_TYPES:
+                exact_rows.extend((page_id, database_id, prop_name, value) for value in _exact_values(prop_data, prop_type))
+        fts_rows.append(("\n".join(all_text), ALL_PROPERTIES))
+
+        for text, prop_name in fts_rows:
+            cursor = self._conn.execute(
+                "INSERT INTO page_fts (value, page_id, database_id, prop) VALUES (?, ?, ?, ?)",
+                (text, page_id, database_id, prop_name),
+            )
+            self._conn.execute(
+                "INSERT INTO fts_rows (fts_rowid, page_id, database_id) VALUES (?, ?, ?)",
+                (cursor.lastrowid, page_id, database_id),
+            )
+        self._conn.executemany("INSERT INTO page_values (page_id, database_id, prop, value) VALUES (?, ?, ?, ?)", exact_rows)
+
+    def _delete_where(self, column: str, value: str):
+        """Apaga as páginas de uma página (`page_id`) ou de uma base (`database_id`) pelas colunas indexadas."""
+        self._conn.execute(f"DELETE FROM page_fts WHERE rowid IN (SELECT fts_rowid FROM fts_rows WHERE {column} = ?)", (value,))
+        for table in ("fts_rows", "page_values", "pages"):
+            self._conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (value,))
+
+    def is_synced(self, database_id: str) -> bool:
+        with self._read_lock:
+            row = self._read_conn.execute("SELECT synced_at FROM synced_databases WHERE database_id = ?", (database_id,)).fetchone()
+        return bool(row) and time.time() - row[0] < self.max_age
+
+    def replace_database(self, database_id: str, pages: Iterable[Dict], extract_text: TextExtractor):
+        """Substitui todo o conteúdo indexado de uma base pelo resultado de uma sincronização completa."""
+        with self._write_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete_where("database_id", database_id)
+                for page in pages:
+                    self._insert_page(page, database_id, extract_text)
+                self._conn.execute(
+                    "INSERT INTO synced_databases (database_id, synced_at) VALUES (?, ?) "
+                    "ON CONFLICT (database_id) DO UPDATE SET synced_at = excluded.synced_at",
+                    (database_id, time.time()),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def upsert_page(self, page: Dict, extract_text: TextExtractor):
+        """Atualiza (ou remove, se arquivada) uma página de uma base já sincronizada."""
+        database_id = _normalize_id((page.get('parent') or {}).get('database_id', ''))
+        if not database_id or not page.get('id'):
+            return
+        with self._write_lock:
+            if not self._conn.execute("SELECT 1 FROM synced_databases WHERE database_id = ?", (database_id,)).fetchone():
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete_where("page_id", _normalize_id(page['id']))
+                if not page.get('archived') and not page.get('in_trash'):
+                    self._insert_page(page, database_id, extract_text)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def remove_page(self, page_id: str):
+        with self._write_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete_where("page_id", _normalize_id(page_id))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def search(self, database_id: str, search_term: str, prop_name: Optional[str] = None,
+               exact: bool = False, limit: int = SEARCH_INDEX_LIMIT, offset: int = 0) -> Optional[List[Dict]]:
+        """
+        Com `exact`, compara o termo com o valor exato da propriedade (opções e pessoas);
+        sem ele, faz a busca de texto ordenada por relevância (bm25). Retorna None se a
+        base ainda não foi sincronizada ou se o termo não tem palavras pesquisáveis.
+        """
+        if not self.is_synced(database_id):
+            return None
+        if exact:
+            if not prop_name or not search_term.strip():
+                return None
+            query = (
+                "SELECT pages.page_json FROM pages WHERE pages.page_id IN ("
+                " SELECT page_id FROM page_values WHERE database_id = ? AND prop = ? AND value = ?) "
+                "ORDER BY pages.rowid LIMIT ? OFFSET ?"
+            )
+            params = (database_id, prop_name, search_term.strip(), limit, offset)
+        else:
+            match_query = build_match_query(search_term)
+            if match_query is None:
+                return None
+            query = (
+                "SELECT pages.page_json FROM page_fts JOIN pages ON pages.page_id = page_fts.page_id "
+                "WHERE page_fts MATCH ? AND page_fts.database_id = ? AND page_fts.prop = ? "
+                "ORDER BY bm25(page_fts), page_fts.rowid LIMIT ? OFFSET ?"
+            )
+            params = (match_query, database_id, prop_name or ALL_PROPERTIES, limit, offset)
+        with self._read_lock:
+            rows = self._read_conn.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+def create_search_index() -> Optional[LocalSearchIndex]:
+    """Cria o índice se ele estiver habilitado e o SQLite tiver suporte a FTS5."""
+    if not SEARCH_INDEX_ENABLED:
+        return None
+    try:
+        return LocalSearchIndex()
+    except sqlite3.OperationalError as e:
+        print(f"AVISO: índice local de busca desativado (SQLite sem suporte a FTS5?): {e}")
+        return None
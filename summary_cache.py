@@ -0,0 +1,132 @@
+# summary_cache.py
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from atomic_files import write_atomic
+
+# Diretório onde os resumos ficam armazenados, um arquivo por transcrição.
+SUMMARY_CACHE_DIR = os.getenv("SUMMARY_CACHE_DIR", ".summary_cache")
+# Tamanho máximo do cache em disco; acima disso os resumos menos usados são removidos.
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv("SUMMARY_CACHE_MAX_BYTES", str(20 * 1024 * 1024)))
+# Quantidade máxima de tópicos com resumo incremental guardado; acima disso os menos usados são removidos.
+THREAD_SUMMARY_MAX_ENTRIES = int(os.getenv("THREAD_SUMMARY_MAX_ENTRIES", "2000"))
+
+
+def _evict_least_recent(directory: str, suffix: str, max_bytes: Optional[int] = None, max_entries: Optional[int] = None):
+    """Remove os arquivos usados há mais tempo (mtime) até o diretório respeitar os limites."""
+    entries, total_size = [], 0
+    with os.scandir(directory) as it:
+        for entry in it:
+            if not entry.is_file() or not entry.name.endswith(suffix):
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+    def over_limit() -> bool:
+        return (max_bytes is not None and total_size > max_bytes) or (max_entries is not None and len(entries) > max_entries)
+
+    entries.sort(reverse=True)
+    while entries and over_limit():
+        _, size, path = entries.pop()
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+def _touch(path: str):
+    # Marca o arquivo como usado recentemente para a política LRU
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+class SummaryCache:
+    """
+    Cache em disco de resumos da IA, endereçado pelo conteúdo: a chave é o hash da
+    transcrição formatada junto com o nome do modelo e a versão do prompt. A
+    recência de uso é registrada no mtime dos arquivos, que orienta a remoção (LRU)
+    quando o diretório passa do tamanho máximo.
+    """
+
+    def __init__(self, directory: str = SUMMARY_CACHE_DIR, max_bytes: int = SUMMARY_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(transcript: str, model_name: str, prompt_version: str) -> str:
+        digest = hashlib.sha256()
+        for part in (model_name, prompt_version, transcript):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                summary = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        _touch(path)
+        self.hits += 1
+        return summary
+
+    def put(self, key: str, summary: str):
+        with self._lock:
+            write_atomic(self._path(key), summary, prefix='.summary-')
+            self._evict()
+
+    def _evict(self):
+        # Só os resumos (*.txt); o estado por tópico tem limite próprio no ThreadSummaryStore
+        _evict_least_recent(self.directory, '.txt', max_bytes=self.max_bytes)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class ThreadSummaryStore:
+    """
+    Guarda, por tópico, o último resumo gerado e o ID da última mensagem coberta
+    por ele (a "marca d'água"), permitindo atualizar o resumo apenas com as
+    mensagens novas. Os tópicos usados há mais tempo são removidos acima de
+    `max_entries`; um tópico removido apenas volta a ser resumido por inteiro.
+    """
+
+    def __init__(self, directory: str = os.path.join(SUMMARY_CACHE_DIR, 'threads'), max_entries: int = THREAD_SUMMARY_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def _path(self, thread_id: int) -> str:
+        return os.path.join(self.directory, f"{int(thread_id)}.json")
+
+    def get(self, thread_id: int) -> Optional[Dict[str, Any]]:
+        path = self._path(thread_id)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        _touch(path)
+        return state
+
+    def put(self, thread_id: int, summary: str, last_message_id: int):
+        content = json.dumps({"summary": summary, "last_message_id": int(last_message_id)})
+        with self._lock:
+            write_atomic(self._path(thread_id), content, prefix='.summary-')
+            _evict_least_recent(self.directory, '.json', max_entries=self.max_entries)
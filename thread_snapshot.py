@@ -0,0 +1,70 @@
+# thread_snapshot.py
+
+import os
+from functools import cached_property
+from typing import List, Dict, Optional
+
+import discord
+
+# Quantidade máxima de mensagens lidas do histórico de um tópico ao criar um card (uma página da
+# API do Discord). Aumente para resumir tópicos longos por inteiro, ao custo de mais paginações.
+THREAD_HISTORY_LIMIT = int(os.getenv("THREAD_HISTORY_LIMIT", "100"))
+
+
+class ThreadSnapshot:
+    """
+    Histórico de um tópico do Discord buscado uma única vez por criação de card.
+    Participantes, anexos e a transcrição para o resumo da IA são derivados
+    dessa mesma leitura, evitando várias paginações da API do Discord.
+    """
+
+    def __init__(self, thread: discord.Thread, messages: List[discord.Message], limit: Optional[int] = None):
+        self.thread = thread
+        # As mensagens ficam na ordem do `history`: da mais nova para a mais antiga
+        self.messages = messages
+        self.limit = limit
+
+    @classmethod
+    async def fetch(cls, thread: discord.Thread, limit: Optional[int] = THREAD_HISTORY_LIMIT) -> "ThreadSnapshot":
+        messages = [message async for message in thread.history(limit=limit)]
+        return cls(thread, messages, limit)
+
+    @property
+    def is_complete(self) -> bool:
+        """Indica se o snapshot contém todo o histórico do tópico."""
+        return self.limit is None or len(self.messages) < self.limit
+
+    async def messages_after(self, message_id: int) -> List[discord.Message]:
+        """
+        Mensagens posteriores a `message_id`, da mais nova para a mais antiga.
+        Usa o histórico já carregado quando ele cobre esse ponto; caso contrário,
+        busca no Discord apenas as mensagens depois dele (`after=`).
+        """
+        if self.is_complete or (self.messages and self.messages[-1].id <= message_id):
+            return [message for message in self.messages if message.id > message_id]
+        return [message async for message in self.thread.history(limit=None, after=discord.Object(id=message_id), oldest_first=False)]
+
+    @cached_property
+    def participants(self) -> set[discord.Member]:
+        """Participantes únicos (não-bots) do tópico."""
+        return {message.author for message in self.messages if not message.author.bot}
+
+    @cached_property
+    def attachments(self) -> List[Dict[str, str]]:
+        """
+        URLs de anexos de imagens, GIFs e vídeos do tópico.
+        Retorna uma lista de dicionários com 'type', 'url' e 'filename'.
+        """
+        attachments_data = []
+        for message in self.messages:
+            for attachment in message.attachments:
+                content_type = attachment.content_type or ''
+                # Verifica se o tipo de arquivo é uma imagem, vídeo ou gif
+                # (Discord trata GIFs como imagens, mas verificamos a extensão por garantia)
+                if content_type.startswith(('image/', 'video/')) or attachment.filename.lower().endswith('.gif'):
+                    attachments_data.append({
+                        "type": content_type.split('/')[0] if content_type else 'image', # 'image' ou 'video'
+                        "url": attachment.url,
+                        "filename": attachment.filename # Pode ser útil para depuração ou nomear o anexo no Notion
+                    })
+        return attachments_data
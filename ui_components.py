@@ -4,60 +4,53 @@ import discord
 from discord import Interaction, SelectOption, ButtonStyle, Color
 from discord.ui import View, Button, Select
 import asyncio
-from typing import List, Optional, Dict, Any
+import os
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple
 from datetime import datetime
 
 # Módulos locais
 from notion_integration import NotionIntegration, NotionAPIError
 from config_utils import save_config
-from ia_processor import summarize_thread_content
+from ia_processor import summarize_thread_snapshot, summary_deadline
+from thread_snapshot import ThreadSnapshot
+from notion_scheduler import background_priority
+from page_index import index_thread_page, page_index
+
+# Tempo máximo (em segundos) para resolver pessoas e obter o schema durante a criação de um card.
+CARD_STEP_TIMEOUT = float(os.getenv("CARD_STEP_TIMEOUT", "15"))
+# Prazo total (em segundos) para gerar o resumo da IA, repassado ao serviço de IA como `summary_deadline`.
+# Se estourar, o card é criado sem resumo.
+CARD_SUMMARY_TIMEOUT = float(os.getenv("CARD_SUMMARY_TIMEOUT", "45"))
+
+# Referências para as tarefas em segundo plano (evita que sejam coletadas antes de terminar)
+_background_tasks: set = set()
 
 # --- FUNÇÕES AUXILIARES DE UI ---
 
-async def get_topic_participants(thread: discord.Thread, limit: int = 100) -> set[discord.Member]:
-    """Busca os participantes únicos de um tópico com base no histórico de mensagens."""
-    participants = set()
-    async for message in thread.history(limit=limit):
-        if not message.author.bot:
-            participants.add(message.author)
-    return participants
+def _run_in_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
 
-async def get_thread_attachments(thread: discord.Thread, limit: int = 100) -> List[Dict[str, str]]:
-    """
-    Busca URLs de anexos de imagens, GIFs e vídeos em um tópico.
-    Retorna uma lista de dicionários com 'type' e 'url'.
+async def _build_notion_page_content(config: dict, snapshot: Optional[ThreadSnapshot], notion_integration: NotionIntegration, summary_timeout: Optional[float] = None) -> Optional[List[Dict]]:
     """
-    attachments_data = []
-    async for message in thread.history(limit=limit):
-        if message.attachments:
-            for attachment in message.attachments:
-                # Verifica se o tipo de arquivo é uma imagem, vídeo ou gif
-                # (Discord trata GIFs como imagens, mas verificamos a extensão por garantia)
-                if attachment.content_type.startswith(('image/', 'video/')) or attachment.filename.lower().endswith(('.gif')):
-                    attachments_data.append({
-                        "type": attachment.content_type.split('/')[0], # 'image' ou 'video'
-                        "url": attachment.url,
-                        "filename": attachment.filename # Pode ser útil para depuração ou nomear o anexo no Notion
-                    })
-    return attachments_data
-
-
-async def _build_notion_page_content(config: dict, thread_context: Optional[discord.Thread], notion_integration: NotionIntegration) -> Optional[List[Dict]]:
-    """
-    Verifica a config, busca histórico/anexos, gera resumo e coleta anexos,
+    Verifica a config, gera o resumo e coleta os anexos a partir do snapshot do tópico,
     retornando o payload completo de blocos do Notion.
     """
     page_content = []
 
-    if not thread_context:
+    if not snapshot:
         return None
 
     # 1. Resumo da IA
     if config.get('ai_summary_enabled'):
-        messages = [msg async for msg in thread_context.history(limit=100)]
-        if messages:
-            summary_text = await summarize_thread_content(messages)
-            if summary_text and not summary_text.startswith("Erro:"):
+        if snapshot.messages:
+            # Resumo incremental: só as mensagens novas desde o último resumo do tópico são enviadas à IA.
+            # O prazo é aplicado pelo próprio serviço de IA, que encaixa timeouts e novas tentativas nele.
+            with summary_deadline(summary_timeout):
+                summary_text = await summarize_thread_snapshot(snapshot)
+            if summary_text and not summary_text.startswith("Erro"):
                 page_content.append({
                     "object": "block",
                     "type": "heading_2",
@@ -71,7 +64,7 @@ async def _build_notion_page_content(config: dict, thread_context: Optional[disc
                 page_content.extend(parsed_summary_blocks) # Adiciona os blocos processados
 
     # 2. Anexos (Imagens, GIFs, Vídeos)
-    attachments = await get_thread_attachments(thread_context)
+    attachments = snapshot.attachments
     if attachments:
         if page_content: # Adiciona um separador se já houver conteúdo
             page_content.append({
@@ -115,20 +108,153 @@ async def _build_notion_page_content(config: dict, thread_context: Optional[disc
     return page_content if page_content else None
 
 
+async def _enrich_card_in_background(notion: NotionIntegration, config: dict, snapshot: ThreadSnapshot, page: dict):
+    """Gera o resumo/anexos de um card já criado, anexa os blocos à página e avisa no tópico."""
+    try:
+        # As escritas desta tarefa cedem a vez às requisições interativas na fila do Notion
+        with background_priority():
+            page_content = await _build_notion_page_content(config, snapshot, notion, summary_timeout=CARD_SUMMARY_TIMEOUT)
+            if not page_content:
+                return
+            await notion.append_block_children(page['id'], page_content)
+        await snapshot.thread.send(f"🤖 O resumo e os anexos do tópico foram adicionados ao card: {page.get('url', '')}")
+    except Exception as e:
+        print(f"Erro ao adicionar conteúdo em segundo plano ao card {page.get('id')}: {e}")
+        try:
+            await snapshot.thread.send(f"⚠️ O card foi criado, mas não foi possível adicionar o resumo/anexos: {e}")
+        except discord.HTTPException:
+            pass
+
+
+async def create_card(notion: NotionIntegration, config: dict, all_properties: list, collected_properties: dict, thread_context: Optional[discord.Thread], author: discord.abc.User) -> dict:
+    """
+    Pipeline de criação de card. Após ler o histórico do tópico, as etapas independentes
+    (resolução de pessoas + schema, e resumo da IA + anexos) rodam em paralelo com
+    timeouts próprios, então a latência total fica próxima da etapa mais lenta.
+    Retorna a página criada no Notion.
+
+    Com `background_content_enabled` na config, a página é criada só com as propriedades
+    e o resumo/anexos são anexados depois por uma tarefa em segundo plano.
+    """
+    collected_properties = dict(collected_properties)
+    title_prop_name = next((p['name'] for p in all_properties if p['type'] == 'title'), None)
+    if not title_prop_name: raise NotionAPIError("Propriedade de Título não encontrada.")
+    title_value = collected_properties.pop(title_prop_name, f"Card criado em {datetime.now().strftime('%d/%m')}")
+
+    # Preenchimento automático de propriedades
+    individual_prop = config.get('individual_person_prop')
+    if individual_prop:
+        collected_properties[individual_prop] = author.display_name
+
+    topic_prop_name = config.get('topic_link_property_name')
+    if topic_prop_name and thread_context:
+        collected_properties[topic_prop_name] = thread_context.jump_url
+
+    # Lê o histórico do tópico uma única vez para participantes, anexos e resumo
+    snapshot = await ThreadSnapshot.fetch(thread_context) if thread_context else None
+    db_url = config['notion_url']
+
+    async def build_properties():
+        collective_prop = config.get('collective_person_prop')
+        if collective_prop and snapshot:
+            # O schema é buscado em paralelo com as pessoas e fica no cache para o build_page_properties
+            people_result, _ = await asyncio.gather(
+                asyncio.wait_for(notion.resolve_people([member.display_name for member in snapshot.participants]), timeout=CARD_STEP_TIMEOUT),
+                asyncio.wait_for(notion.get_database_properties(db_url), timeout=CARD_STEP_TIMEOUT),
+                return_exceptions=True,
+            )
+            if isinstance(people_result, BaseException):
+                print(f"Aviso: não foi possível resolver os participantes do tópico: {people_result!r}")
+            else:
+                collected_properties[collective_prop] = people_result
+        return await asyncio.wait_for(notion.build_page_properties(db_url, title_value, collected_properties), timeout=CARD_STEP_TIMEOUT)
+
+    if config.get('background_content_enabled') and snapshot:
+        response = await notion.insert_into_database(db_url, await build_properties())
+        _run_in_background(_enrich_card_in_background(notion, config, snapshot, response))
+    else:
+        async def build_content():
+            # Falhas no resumo/anexos não impedem a criação do card
+            try:
+                return await _build_notion_page_content(config, snapshot, notion, summary_timeout=CARD_SUMMARY_TIMEOUT)
+            except Exception as e:
+                print(f"Aviso: o card será criado sem resumo/anexos: {e!r}")
+                return None
+
+        content_task = asyncio.create_task(build_content())
+        try:
+            page_properties = await build_properties()
+        except BaseException:
+            # Sem propriedades não há card: o resumo não deve continuar chamando a IA nem gravando estado
+            content_task.cancel()
+            raise
+        page_content = await content_task
+        response = await notion.insert_into_database(db_url, page_properties, children=page_content)
+
+    # Registra o tópico de origem para que os webhooks desta página sejam roteados sem buscas extras
+    if thread_context:
+        index_thread_page(response.get('id'), thread_context)
+    return response
+
+
+async def send_search_results(interaction: Interaction, notion: NotionIntegration, config: dict, search_term: str, selected_property: Optional[dict]):
+    """
+    Executa a busca e envia o primeiro card com um PaginationView. Os resultados vêm
+    do índice local quando ele está ativo e responde à busca; caso contrário, a busca
+    é feita em streaming no Notion, carregando as próximas páginas sob demanda.
+    Sem `selected_property`, o termo é procurado em todas as propriedades.
+    A interação já deve ter sido adiada (defer).
+    """
+    prop_name = selected_property['name'] if selected_property else None
+    prop_type = selected_property['type'] if selected_property else None
+    stream = await notion.search_local(config['notion_url'], search_term, prop_name, prop_type)
+    if stream is None:
+        stream = notion.stream_search(config['notion_url'], search_term, prop_name, prop_type)
+    view = PaginationView(interaction.user, [], config, notion, actions=['edit', 'delete', 'share'], result_stream=stream)
+    await view.load_more()
+    if not view.results:
+        return await interaction.followup.send(f"❌ Nenhum resultado para '{search_term}'.", ephemeral=True)
+
+    count_text = f"{len(view.results)}+" if view.has_more else f"{len(view.results)}"
+    await interaction.followup.send(f"✅ {count_text} resultado(s) encontrado(s)!", ephemeral=True)
+
+    view.update_nav_buttons()
+    await interaction.followup.send(embed=await view.get_page_embed(), view=view, ephemeral=True)
+
+
+def _format_staged_changes(staged_changes: Dict[str, tuple]) -> str:
+    """Lista as alterações ainda não salvas, para revisão do usuário."""
+    lines = []
+    for prop_name, (_, value) in staged_changes.items():
+        display_value = ", ".join(value) if isinstance(value, list) else str(value)
+        lines.append(f"• **{prop_name}**: {display_value[:200]}")
+    return "\n".join(lines)
+
+
 async def start_editing_flow(interaction: Interaction, page_id_to_edit: str, config: dict, notion: NotionIntegration):
     """
     Inicia o fluxo completo de edição de um card do Notion,
     controlado por interações do Discord.
+
+    As alterações ficam em uma sessão local até o usuário revisá-las e salvar; então
+    todas as propriedades são enviadas em um único `pages.update`, e o embed final é
+    montado a partir da resposta dessa atualização. Se um menu expirar com alterações
+    pendentes, elas são salvas; só o botão Descartar as abandona.
     """
     try:
-        all_db_props = notion.get_properties_for_interaction(config['notion_url'])
+        all_db_props = await notion.get_properties_for_interaction(config['notion_url'])
         editable_props = [p for p in all_db_props if p['name'] in config.get('create_properties', [])]
 
         prop_msg = await interaction.followup.send("Iniciando edição...", ephemeral=True)
+        # Sessão de edição: nome da propriedade -> (tipo, novo valor), na ordem em que foram alteradas
+        staged_changes: Dict[str, tuple] = {}
 
         while True:
             prop_select_view = View(timeout=180.0)
-            prop_select = Select(placeholder="Escolha uma propriedade para editar...", options=[SelectOption(label=p['name'], description=f"Tipo: {p['type']}") for p in editable_props[:25]])
+            prop_select = Select(placeholder="Escolha uma propriedade para editar...", options=[
+                SelectOption(label=p['name'], description=f"Tipo: {p['type']}" + (" • alterada" if p['name'] in staged_changes else ""))
+                for p in editable_props[:25]
+            ])
             prop_select_view.add_item(prop_select)
 
             await prop_msg.edit(content="Qual propriedade você quer alterar agora?", view=prop_select_view)
@@ -143,8 +269,11 @@ async def start_editing_flow(interaction: Interaction, page_id_to_edit: str, con
             await prop_select_view.wait()
 
             if prop_choice_interaction is None:
-                await prop_msg.edit(content="⌛ Edição cancelada ou tempo esgotado.", view=None)
-                break
+                if staged_changes:
+                    await prop_msg.edit(content=f"⌛ Tempo esgotado. Salvando {len(staged_changes)} alteração(ões) pendente(s)...", view=None)
+                    break
+                await prop_msg.edit(content="⌛ Edição cancelada ou tempo esgotado. Nenhuma alteração foi salva.", view=None)
+                return
 
             selected_prop_name = prop_select.values[0]
             selected_prop_details = next((p for p in editable_props if p['name'] == selected_prop_name), None)
@@ -193,19 +322,37 @@ async def start_editing_flow(interaction: Interaction, page_id_to_edit: str, con
                 await asyncio.sleep(5)
                 continue
 
-            await prop_msg.edit(content=f"⚙️ Atualizando propriedade...", view=None)
-            properties_payload = notion.build_update_payload(selected_prop_name, prop_type, new_value)
-            notion.update_page(page_id_to_edit, properties_payload)
+            # A alteração só é registrada na sessão; nada é enviado ao Notion ainda
+            staged_changes.pop(selected_prop_name, None)
+            staged_changes[selected_prop_name] = (prop_type, new_value)
 
             continue_view = ContinueEditingView(interaction.user.id)
-            await prop_msg.edit(content=f"✅ Propriedade **{selected_prop_name}** atualizada!\nDeseja continuar editando?", view=continue_view)
+            await prop_msg.edit(
+                content=f"📝 Alterações pendentes:\n{_format_staged_changes(staged_changes)}\n\nDeseja editar outra propriedade ou salvar?",
+                view=continue_view,
+            )
             await continue_view.wait()
 
+            if continue_view.choice == 'discard':
+                await prop_msg.edit(content="🗑️ Alterações descartadas. Nada foi salvo no Notion.", view=None)
+                return
             if continue_view.choice == 'finish':
-                await prop_msg.edit(content="Finalizando...", view=None)
+                await prop_msg.edit(content=f"⚙️ Salvando {len(staged_changes)} alteração(ões)...", view=None)
+                break
+            if continue_view.choice is None:
+                # Sem resposta: as alterações revisadas não são perdidas
+                await prop_msg.edit(content=f"⌛ Tempo esgotado. Salvando {len(staged_changes)} alteração(ões) pendente(s)...", view=None)
                 break
 
-        final_page_data = notion.get_page(page_id_to_edit)
+        properties_payload = {}
+        for prop_name, (prop_type, value) in staged_changes.items():
+            properties_payload.update(await notion.build_update_payload(prop_name, prop_type, value))
+        if not properties_payload:
+            await prop_msg.edit(content="❌ Nenhuma alteração válida para salvar.", view=None)
+            return
+
+        # Uma única escrita para todas as propriedades; a resposta já traz a página atualizada
+        final_page_data = await notion.update_page(page_id_to_edit, properties_payload)
         display_names = config.get('display_properties', [])
         final_embed = notion.format_page_for_embed(final_page_data, display_properties=display_names)
 
@@ -263,7 +410,8 @@ class CardActionView(View):
             confirm_view.stop()
             try:
                 await inter.response.defer(ephemeral=True, thinking=True)
-                self.notion.delete_page(self.page_id)
+                await self.notion.delete_page(self.page_id)
+                page_index.remove(self.page_id)
 
                 for item in self.children: item.disabled = True
 
@@ -286,11 +434,18 @@ class CardActionView(View):
 
 
 class PaginationView(View):
-    def __init__(self, author: discord.Member, results: list, config: dict, notion: NotionIntegration, actions: List[str] = []):
+    """
+    Navega por uma lista de cards. Se `result_stream` for informado (ex.: `NotionIntegration.stream_search`,
+    que produz (resultados, has_more)), os resultados são carregados sob demanda: a próxima página do
+    Notion só é buscada quando o usuário avança além dos resultados já carregados.
+    """
+    def __init__(self, author: discord.Member, results: list, config: dict, notion: NotionIntegration, actions: List[str] = [], result_stream: Optional[AsyncIterator[Tuple[List[Dict], bool]]] = None):
         super().__init__(timeout=300.0)
-        self.author, self.results, self.config, self.actions = author, results, config, actions
+        self.author, self.results, self.config, self.actions = author, list(results), config, actions
         self.notion = notion
-        self.current_page, self.total_pages = 0, len(results)
+        self.result_stream = result_stream
+        self.has_more = result_stream is not None
+        self.current_page, self.total_pages = 0, len(self.results)
 
         if 'edit' not in self.actions: self.remove_item(self.edit_button)
         if 'delete' not in self.actions: self.remove_item(self.delete_button)
@@ -302,6 +457,26 @@ class PaginationView(View):
             return False
         return True
 
+    async def load_more(self) -> bool:
+        """Busca a próxima página de resultados do stream. Retorna True se novos resultados foram carregados."""
+        if not self.has_more:
+            return False
+        try:
+            batch, self.has_more = await self.result_stream.__anext__()
+        except StopAsyncIteration:
+            self.has_more = False
+            return False
+        if not self.has_more:
+            # O Notion informou que não há mais páginas: libera o stream sem pedir outra
+            await self.result_stream.aclose()
+        self.results.extend(batch)
+        self.total_pages = len(self.results)
+        return bool(batch)
+
+    async def on_timeout(self):
+        if self.result_stream is not None:
+            await self.result_stream.aclose()
+
     def get_current_page_data(self):
         return self.results[self.current_page]
 
@@ -312,12 +487,13 @@ class PaginationView(View):
             display_properties=self.config.get('display_properties', []),
             include_footer=True
         )
-        embed.set_footer(text=f"Card {self.current_page + 1} de {self.total_pages}")
+        total_text = f"{self.total_pages}+" if self.has_more else f"{self.total_pages}"
+        embed.set_footer(text=f"Card {self.current_page + 1} de {total_text}")
         return embed
 
     def update_nav_buttons(self):
         self.previous_button.disabled = self.current_page == 0
-        self.next_button.disabled = self.current_page == self.total_pages - 1
+        self.next_button.disabled = self.current_page >= self.total_pages - 1 and not self.has_more
 
     @discord.ui.button(label="⬅️", style=ButtonStyle.secondary, row=0)
     async def previous_button(self, interaction: Interaction, button: Button):
@@ -327,6 +503,14 @@ class PaginationView(View):
 
     @discord.ui.button(label="➡️", style=ButtonStyle.secondary, row=0)
     async def next_button(self, interaction: Interaction, button: Button):
+        if self.current_page >= self.total_pages - 1 and self.has_more:
+            # Busca a próxima página no Notion; adia a resposta para não estourar o limite de 3s
+            await interaction.response.defer()
+            await self.load_more()
+            if self.current_page < self.total_pages - 1: self.current_page += 1
+            self.update_nav_buttons()
+            await interaction.edit_original_response(embed=await self.get_page_embed(), view=self)
+            return
         if self.current_page < self.total_pages - 1: self.current_page += 1
         self.update_nav_buttons()
         await interaction.response.edit_message(embed=await self.get_page_embed(), view=self)
@@ -350,7 +534,8 @@ class PaginationView(View):
         async def yes_callback(inter: Interaction):
             await inter.response.defer(ephemeral=True, thinking=True)
             try:
-                self.notion.delete_page(page_id)
+                await self.notion.delete_page(page_id)
+                page_index.remove(page_id)
                 await interaction.edit_original_response(content="✅ Card excluído com sucesso.", view=None, embed=None)
                 await inter.followup.send("Confirmado!", ephemeral=True)
             except Exception as e:
@@ -390,6 +575,13 @@ class SearchModal(discord.ui.Modal):
         self.search_term_input = discord.ui.TextInput(label="Digite o termo que você quer procurar", style=discord.TextStyle.short, placeholder="Ex: 'Card de Teste'", required=True)
         self.add_item(self.search_term_input)
 
+    async def on_submit(self, interaction: Interaction):
+        await interaction.response.defer(thinking=True, ephemeral=True)
+        try:
+            await send_search_results(interaction, self.notion, self.config, self.search_term_input.value, self.selected_property)
+        except NotionAPIError as e:
+            await interaction.followup.send(f"❌ Erro com o Notion: {e}", ephemeral=True)
+
 async def on_submit(self, interaction: Interaction):
     collected_from_modal = {name: item.value for name, item in self.text_inputs.items() if item.value}
 
@@ -399,34 +591,7 @@ async def on_submit(self, interaction: Interaction):
             # Responde à interação para que o usuário saiba que algo está acontecendo
             await interaction.response.send_message("⚙️ Processando e criando seu card no Notion...", ephemeral=True)
 
-            title_prop_name = next((p['name'] for p in self.all_properties if p['type'] == 'title'), None)
-            if not title_prop_name: raise NotionAPIError("Propriedade de Título não encontrada.")
-            title_value = collected_from_modal.pop(title_prop_name, f"Card criado em {datetime.now().strftime('%d/%m')}")
-
-            # Preenchimento automático de propriedades
-            individual_prop = self.config.get('individual_person_prop')
-            if individual_prop:
-                collected_from_modal[individual_prop] = interaction.user.display_name
-
-            collective_prop = self.config.get('collective_person_prop')
-            if collective_prop and self.thread_context:
-                participants = await get_topic_participants(self.thread_context)
-                notion_user_ids = [self.notion.search_id_person(member.display_name) for member in participants]
-                collected_from_modal[collective_prop] = [uid for uid in notion_user_ids if uid]
-
-            topic_prop_name = self.config.get('topic_link_property_name')
-            if topic_prop_name and self.thread_context:
-                collected_from_modal[topic_prop_name] = self.thread_context.jump_url
-
-            page_content = await _build_notion_page_content(self.config, self.thread_context, self.notion)
-
-            # Cria a página no Notion
-            page_properties = self.notion.build_page_properties(self.config['notion_url'], title_value, collected_from_modal)
-            response = self.notion.insert_into_database(
-                self.config['notion_url'],
-                page_properties,
-                children=page_content
-            )
+            response = await create_card(self.notion, self.config, self.all_properties, collected_from_modal, self.thread_context, interaction.user)
 
             # Formata e envia a resposta final
             display_names = self.config.get('display_properties', [])
@@ -522,35 +687,7 @@ class CardSelectPropertiesView(View):
         for item in self.children: item.disabled = True
         await interaction.response.defer(ephemeral=True, thinking=True)
         try:
-            title_prop_name = next((p['name'] for p in self.all_properties if p['type'] == 'title'), None)
-            if not title_prop_name: raise NotionAPIError("Nenhuma propriedade de Título foi encontrada.")
-
-            title_value = self.collected_properties.pop(title_prop_name, f"Card criado em {datetime.now().strftime('%d/%m')}")
-
-            individual_prop = self.config.get('individual_person_prop')
-            if individual_prop:
-                self.collected_properties[individual_prop] = interaction.user.display_name
-
-            collective_prop = self.config.get('collective_person_prop')
-            if collective_prop and self.thread_context:
-                participants = await get_topic_participants(self.thread_context)
-                notion_user_ids = [self.notion.search_id_person(member.display_name) for member in participants]
-                self.collected_properties[collective_prop] = [uid for uid in notion_user_ids if uid]
-
-            topic_prop_name = self.config.get('topic_link_property_name')
-            if topic_prop_name and self.thread_context:
-                self.collected_properties[topic_prop_name] = self.thread_context.jump_url
-
-            # CORREÇÃO APLICADA AQUI: Passando self.notion como argumento
-            page_content = await _build_notion_page_content(self.config, self.thread_context, self.notion) #
-
-            # Modifica a chamada para a criação da página
-            page_properties = self.notion.build_page_properties(self.config['notion_url'], title_value, self.collected_properties)
-            response = self.notion.insert_into_database(
-                self.config['notion_url'],
-                page_properties,
-                children=page_content
-            )
+            response = await create_card(self.notion, self.config, self.all_properties, self.collected_properties, self.thread_context, interaction.user)
 
             await interaction.edit_original_response(content="✅ Card criado com sucesso! Veja abaixo.", view=None)
 
@@ -599,34 +736,7 @@ class CardModal(discord.ui.Modal):
 
         if not self.select_props:
             try:
-                title_prop_name = next((p['name'] for p in self.all_properties if p['type'] == 'title'), None)
-                if not title_prop_name: raise NotionAPIError("Propriedade de Título não encontrada.")
-                title_value = collected_from_modal.pop(title_prop_name, f"Card criado em {datetime.now().strftime('%d/%m')}")
-
-                individual_prop = self.config.get('individual_person_prop')
-                if individual_prop:
-                    collected_from_modal[individual_prop] = interaction.user.display_name
-
-                collective_prop = self.config.get('collective_person_prop')
-                if collective_prop and self.thread_context:
-                    participants = await get_topic_participants(self.thread_context)
-                    notion_user_ids = [self.notion.search_id_person(member.display_name) for member in participants]
-                    collected_from_modal[collective_prop] = [uid for uid in notion_user_ids if uid]
-
-                topic_prop_name = self.config.get('topic_link_property_name')
-                if topic_prop_name and self.thread_context:
-                    collected_from_modal[topic_prop_name] = self.thread_context.jump_url
-
-                # CORREÇÃO APLICADA AQUI: Passando self.notion como argumento
-                page_content = await _build_notion_page_content(self.config, self.thread_context, self.notion) #
-
-                # Modifica a chamada para a criação da página
-                page_properties = self.notion.build_page_properties(self.config['notion_url'], title_value, collected_from_modal)
-                response = self.notion.insert_into_database(
-                    self.config['notion_url'],
-                    page_properties,
-                    children=page_content
-                )
+                response = await create_card(self.notion, self.config, self.all_properties, collected_from_modal, self.thread_context, interaction.user)
 
                 display_names = self.config.get('display_properties', [])
                 final_embed = self.notion.format_page_for_embed(response, display_properties=display_names)
@@ -662,11 +772,16 @@ class ContinueEditingView(View):
         self.choice = 'continue'
         await interaction.response.edit_message(content="Continuando edição...", view=None)
         self.stop()
-    @discord.ui.button(label="✅ Concluir Edição", style=ButtonStyle.success)
+    @discord.ui.button(label="✅ Salvar Alterações", style=ButtonStyle.success)
     async def finish_editing(self, interaction: Interaction, button: Button):
         self.choice = 'finish'
         await interaction.response.edit_message(content="Finalizando...", view=None)
         self.stop()
+    @discord.ui.button(label="🗑️ Descartar", style=ButtonStyle.danger)
+    async def discard_editing(self, interaction: Interaction, button: Button):
+        self.choice = 'discard'
+        await interaction.response.edit_message(content="Descartando alterações...", view=None)
+        self.stop()
 
 
 class PersonSelectView(View):
@@ -757,9 +872,31 @@ class ManagementView(View):
         self.stop()
 
 
+    @discord.ui.button(label="Conteúdo em Segundo Plano", style=ButtonStyle.secondary, emoji="⏱️", row=1)
+    async def manage_background_content(self, interaction: Interaction, button: Button):
+        is_enabled = self.config.get('background_content_enabled', False) # Padrão é desativado
+        toggle_view = View(timeout=60.0)
+        button_label = "Desativar Conteúdo em Segundo Plano" if is_enabled else "Ativar Conteúdo em Segundo Plano"
+        button_style = ButtonStyle.danger if is_enabled else ButtonStyle.success
+        toggle_button = Button(label=button_label, style=button_style)
+
+        async def toggle_callback(inter: Interaction):
+            new_state = not is_enabled
+            save_config(self.guild_id, self.channel_id, {'background_content_enabled': new_state})
+            status_text = "ATIVADO" if new_state else "DESATIVADO"
+            await inter.response.edit_message(content=f"✅ Conteúdo em segundo plano foi **{status_text}**.", view=None)
+
+        toggle_button.callback = toggle_callback
+        toggle_view.add_item(toggle_button)
+
+        status_atual = "ATIVADO" if is_enabled else "DESATIVADO"
+        msg = f"O conteúdo em segundo plano está **{status_atual}**.\n\nQuando ativado, o card é criado imediatamente apenas com as propriedades, e o resumo da IA e os anexos do tópico são adicionados depois, com um aviso no tópico quando terminar."
+        await interaction.response.send_message(msg, view=toggle_view, ephemeral=True)
+        self.stop()
+
     @discord.ui.button(label="Configurar Link de Tópico", style=ButtonStyle.secondary, emoji="🔗", row=2)
     async def configure_topic_link(self, interaction: Interaction, button: Button):
-        all_props = self.notion.get_properties_for_interaction(self.config['notion_url'])
+        all_props = await self.notion.get_properties_for_interaction(self.config['notion_url'])
         compatible_props = [p for p in all_props if p['type'] in ['rich_text', 'url']]
         if not compatible_props:
             return await interaction.response.send_message("❌ Nenhuma propriedade compatível (Texto/URL) encontrada.", ephemeral=True)
@@ -773,7 +910,7 @@ class ManagementView(View):
 
     @discord.ui.button(label="Definir Dono do Card", style=ButtonStyle.secondary, emoji="👤", row=3)
     async def configure_individual_person(self, interaction: Interaction, button: Button):
-        all_props = self.notion.get_properties_for_interaction(self.config['notion_url'])
+        all_props = await self.notion.get_properties_for_interaction(self.config['notion_url'])
         people_props = [p for p in all_props if p['type'] == 'people']
         if not people_props:
             return await interaction.response.send_message("❌ Nenhuma propriedade 'Pessoa' encontrada.", ephemeral=True)
@@ -787,7 +924,7 @@ class ManagementView(View):
 
     @discord.ui.button(label="Definir Envolvidos do Tópico", style=ButtonStyle.secondary, emoji="👥", row=3)
     async def configure_collective_person(self, interaction: Interaction, button: Button):
-        all_props = self.notion.get_properties_for_interaction(self.config['notion_url'])
+        all_props = await self.notion.get_properties_for_interaction(self.config['notion_url'])
         people_props = [p for p in all_props if p['type'] == 'people']
         if not people_props:
             return await interaction.response.send_message("❌ Nenhuma propriedade 'Pessoa' encontrada.", ephemeral=True)
@@ -1,20 +1,86 @@
 # webhook_server.py
 
-from flask import Flask, request, jsonify
-from threading import Thread
+from aiohttp import web
+from collections import OrderedDict
 import asyncio
+import hashlib
+import json
 import re
 import os
-from notion_integration import NotionIntegration, NotionAPIError
+import time
+from notion_integration import NotionAPIError, get_notion_integration
+from notion_scheduler import background_priority
+from page_index import index_thread_page, page_index
 from config_utils import load_config
 import discord
 
-# Inicializa o Flask
-app = Flask(__name__)
+# Quantidade máxima de webhooks aguardando processamento; acima disso respondemos 503.
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "100"))
+# Quantidade de tarefas que processam os webhooks da fila em paralelo.
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+# Valor (em segundos) do cabeçalho Retry-After enviado quando a fila está cheia.
+WEBHOOK_RETRY_AFTER = int(os.getenv("WEBHOOK_RETRY_AFTER", "5"))
+# Janela (em segundos) em que vários webhooks da mesma página são combinados em um só.
+WEBHOOK_COALESCE_WINDOW = float(os.getenv("WEBHOOK_COALESCE_WINDOW", "3"))
+# Tempo (em segundos) que o ID de um evento já recebido é lembrado para descartar reenvios.
+WEBHOOK_EVENT_TTL = float(os.getenv("WEBHOOK_EVENT_TTL", "600"))
+# Quantidade máxima de IDs de eventos lembrados.
+WEBHOOK_EVENT_CACHE_SIZE = int(os.getenv("WEBHOOK_EVENT_CACHE_SIZE", "1000"))
 
-# Variáveis globais para acessar o bot e o loop de eventos
+# Variável global para acessar o bot
 BOT_INSTANCE = None
-BOT_LOOP = None
+
+# Estado do servidor: fila de eventos, tarefas consumidoras e o runner do aiohttp
+_webhook_queue: asyncio.Queue | None = None
+_workers: list[asyncio.Task] = []
+_runner: web.AppRunner | None = None
+# Eventos aguardando o fim da janela de combinação: page_id -> payload mais recente
+_pending_pages: dict[str, dict] = {}
+# Referências para as tarefas da janela de combinação (evita que sejam coletadas antes de terminar)
+_flush_tasks: set[asyncio.Task] = set()
+
+
+class RecentEventCache:
+    """Lembra, por um tempo limitado, os IDs dos eventos já recebidos."""
+
+    def __init__(self, ttl: float = WEBHOOK_EVENT_TTL, max_size: int = WEBHOOK_EVENT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._seen: OrderedDict[str, float] = OrderedDict()
+
+    def _expire(self, now: float):
+        # Entradas são inseridas em ordem cronológica, então as expiradas ficam no início
+        while self._seen and next(iter(self._seen.values())) < now - self.ttl:
+            self._seen.popitem(last=False)
+
+    def seen(self, event_id: str) -> bool:
+        """Retorna True se o evento já foi aceito dentro do TTL (não registra nada)."""
+        self._expire(time.monotonic())
+        return event_id in self._seen
+
+    def add(self, event_id: str):
+        """Registra um evento aceito; só eventos aceitos contam como repetidos depois."""
+        now = time.monotonic()
+        self._expire(now)
+        self._seen[event_id] = now
+        self._seen.move_to_end(event_id)
+        if len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+_recent_events = RecentEventCache()
+
+
+def _event_id(data: dict) -> str:
+    """ID do evento enviado pelo Notion ou, na falta dele, um hash do próprio payload."""
+    event_id = data.get('id') or data.get('event_id')
+    if event_id:
+        return str(event_id)
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _page_id(data: dict) -> str | None:
+    page = data.get('page')
+    return page.get('id') if isinstance(page, dict) else None
 
 def extract_thread_id_from_url(url: str) -> int | None:
     """Extrai o ID do tópico/canal de uma URL do Discord."""
@@ -26,6 +92,22 @@ def extract_thread_id_from_url(url: str) -> int | None:
         return int(match.group(1))
     return None
 
+def _find_thread_link(full_page: dict) -> tuple[int | None, int | None]:
+    """
+    Procura nas propriedades da página a URL do tópico do Discord e retorna
+    (guild_id, thread_id). Usado para páginas que não estão no índice.
+    """
+    # Como não sabemos a guild, não podemos carregar a config diretamente.
+    # Primeiro, precisamos encontrar a URL do discord na página.
+    for prop_name, prop_value in full_page.get("properties", {}).items():
+        if prop_value.get("type") == "url" and prop_value["url"] and "discord.com/channels" in prop_value["url"]:
+            thread_url = prop_value["url"]
+            # Extrai o guild_id da URL para carregar a config correta
+            match = re.search(r'discord.com/channels/(\d+)', thread_url)
+            guild_id = int(match.group(1)) if match else None
+            return guild_id, extract_thread_id_from_url(thread_url)
+    return None, None
+
 async def process_webhook_and_notify(data):
     """
     Função assíncrona que processa o payload do webhook e envia a notificação.
@@ -48,42 +130,41 @@ async def process_webhook_and_notify(data):
 
         # Para obter a config, precisamos primeiro do link do tópico,
         # que nos dará o guild_id e channel_id.
-        notion = NotionIntegration()
-        
-        # O webhook pode não conter todas as propriedades, então fazemos um retrieve
-        full_page = notion.get_page(page_id)
-        
-        # Encontrar a propriedade que guarda o link do tópico
-        # Precisamos iterar sobre as configs para encontrar a correta
-        # Nota: Esta parte é complexa, pois não sabemos o guild/channel de antemão.
-        # A abordagem mais robusta é encontrar a propriedade de URL e extrair dela.
+        notion = get_notion_integration()
         
-        thread_url = None
-        topic_prop_name = None
-        guild_id = None
-
-        # Como não sabemos a guild, não podemos carregar a config diretamente.
-        # Primeiro, precisamos encontrar a URL do discord na página.
-        for prop_name, prop_value in full_page.get("properties", {}).items():
-            if prop_value.get("type") == "url" and prop_value["url"] and "discord.com/channels" in prop_value["url"]:
-                thread_url = prop_value["url"]
-                # Extrai o guild_id da URL para carregar a config correta
-                match = re.search(r'discord.com/channels/(\d+)', thread_url)
-                if match:
-                    guild_id = int(match.group(1))
-                break
-
-        if not thread_url or not guild_id:
-            print(f"Webhook para page {page_id} recebido, mas não foi encontrado um link de tópico do Discord válido.")
-            return
-            
-        thread_id = extract_thread_id_from_url(thread_url)
-        if not thread_id:
+        # O webhook pode não conter todas as propriedades, então fazemos um retrieve.
+        # Notificações não têm ninguém esperando na tela, então cedem a vez aos comandos.
+        with background_priority():
+            full_page = await notion.get_page(page_id)
+        # Mantém o índice local de busca em dia com as alterações feitas fora do bot
+        await notion.index_page(full_page)
+        if full_page.get('archived') or full_page.get('in_trash'):
+            # Página apagada fora do bot: não há mais o que notificar, e ela sai do índice
+            page_index.remove(page_id)
             return
+        
+        route = page_index.get(page_id)
+        if route:
+            # Página criada pelo bot: o destino vem do índice, sem varrer propriedades.
+            # Tópicos já em cache no bot dispensam a chamada à API do Discord.
+            guild_id, config_channel_id, thread_id = route['guild_id'], route['channel_id'], route['thread_id']
+            try:
+                thread = BOT_INSTANCE.get_channel(thread_id) or await BOT_INSTANCE.fetch_channel(thread_id)
+            except discord.NotFound:
+                print(f"Tópico {thread_id} da página {page_id} não existe mais; removendo do índice.")
+                page_index.remove(page_id)
+                return
+        else:
+            guild_id, thread_id = _find_thread_link(full_page)
+            if not guild_id or not thread_id:
+                print(f"Webhook para page {page_id} recebido, mas não foi encontrado um link de tópico do Discord válido.")
+                return
 
-        # Agora tentamos buscar o tópico para obter o channel_id e carregar a config
-        thread = await BOT_INSTANCE.fetch_channel(thread_id)
-        config_channel_id = thread.parent_id
+            # Agora tentamos buscar o tópico para obter o channel_id e carregar a config
+            thread = await BOT_INSTANCE.fetch_channel(thread_id)
+            config_channel_id = thread.parent_id
+            # Os próximos webhooks desta página já saem do índice
+            index_thread_page(page_id, thread)
         
         config = load_config(guild_id, config_channel_id)
         if not config:
@@ -106,39 +187,102 @@ async def process_webhook_and_notify(data):
         print(f"Erro inesperado ao processar webhook: {e}")
 
 
-@app.route('/notion-webhook', methods=['POST'])
-def notion_webhook_receiver():
+async def notion_webhook_receiver(request: web.Request) -> web.Response:
     """
-    Endpoint que recebe a notificação do Notion.
+    Endpoint que recebe a notificação do Notion. Descarta eventos repetidos, combina
+    rajadas da mesma página e enfileira o evento; o processamento acontece nas
+    tarefas consumidoras.
     """
     # Notion pode enviar um 'challenge' para verificar a URL
     if request.headers.get('X-Notion-Webhook-Challenge'):
         challenge = request.headers.get('X-Notion-Webhook-Challenge')
         print(f"Respondendo ao desafio do Notion com: {challenge}")
-        return challenge, 200
+        return web.Response(text=challenge, status=200)
+
+    if _webhook_queue is None or not BOT_INSTANCE:
+        return web.json_response({"error": "Bot not ready"}, status=503, headers={"Retry-After": str(WEBHOOK_RETRY_AFTER)})
+
+    try:
+        data = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return web.json_response({"error": "Invalid JSON"}, status=400)
+    if not isinstance(data, dict):
+        return web.json_response({"error": "Payload must be a JSON object"}, status=400)
+
+    event_id = _event_id(data)
+    if _recent_events.seen(event_id):
+        # Reenvio de um evento já aceito: confirma sem processar de novo
+        return web.json_response({"status": "duplicate"}, status=200)
+
+    page_id = _page_id(data)
+    if page_id and page_id in _pending_pages:
+        # Já há um evento desta página na janela de combinação: fica só o payload mais recente
+        _pending_pages[page_id] = data
+        _recent_events.add(event_id)
+        return web.json_response({"status": "coalesced"}, status=200)
+
+    if _webhook_queue.qsize() + len(_pending_pages) >= _webhook_queue.maxsize:
+        # Backpressure: o Notion tenta de novo mais tarde em vez de acumularmos eventos sem limite.
+        # O evento não é registrado como recebido, para que o reenvio seja processado.
+        print("Aviso: fila de webhooks cheia; respondendo 503.")
+        return web.json_response({"error": "Queue full"}, status=503, headers={"Retry-After": str(WEBHOOK_RETRY_AFTER)})
 
-    if not BOT_LOOP:
-        return jsonify({"error": "Bot event loop not ready"}), 503
+    if page_id:
+        _pending_pages[page_id] = data
+        task = asyncio.create_task(_flush_page_after_window(page_id))
+        _flush_tasks.add(task)
+        task.add_done_callback(_flush_tasks.discard)
+    else:
+        _webhook_queue.put_nowait(data)
+    _recent_events.add(event_id)
 
-    # Dispara a função assíncrona em um ambiente thread-safe
-    data = request.json
-    asyncio.run_coroutine_threadsafe(process_webhook_and_notify(data), BOT_LOOP)
-    
-    return jsonify({"status": "received"}), 200
+    return web.json_response({"status": "received"}, status=200)
 
 
-def run_server(bot_instance, bot_loop):
+async def _flush_page_after_window(page_id: str):
+    """Ao fim da janela, envia para a fila um único evento com o payload mais recente da página."""
+    await asyncio.sleep(WEBHOOK_COALESCE_WINDOW)
+    data = _pending_pages.pop(page_id, None)
+    if data is not None:
+        await _webhook_queue.put(data)
+
+
+async def _webhook_worker():
+    """Consome a fila de webhooks, processando um evento por vez."""
+    while True:
+        data = await _webhook_queue.get()
+        try:
+            await process_webhook_and_notify(data)
+        except Exception as e:
+            print(f"Erro inesperado no processamento de webhook: {e}")
+        finally:
+            _webhook_queue.task_done()
+
+
+async def start_server(bot_instance):
     """
-    Inicia o servidor Flask em uma thread separada.
+    Inicia o servidor de webhook (aiohttp) no event loop do próprio bot, junto com
+    as tarefas que consomem a fila. Chamadas repetidas (ex.: `on_ready` disparado
+    de novo após uma reconexão) não iniciam um segundo servidor.
     """
-    global BOT_INSTANCE, BOT_LOOP
+    global BOT_INSTANCE, _webhook_queue, _runner
     BOT_INSTANCE = bot_instance
-    BOT_LOOP = bot_loop
-    
+    if _runner is not None:
+        return
+
+    # O índice de páginas é lido do disco uma vez, fora do event loop
+    await asyncio.to_thread(page_index.preload)
+    _webhook_queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+    _workers.extend(asyncio.create_task(_webhook_worker()) for _ in range(WEBHOOK_WORKERS))
+
+    app = web.Application()
+    app.router.add_post('/notion-webhook', notion_webhook_receiver)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+
     # Use '0.0.0.0' para ser acessível externamente (necessário para o Render)
     # A porta é geralmente definida por uma variável de ambiente pela plataforma de hospedagem
     port = int(os.environ.get('PORT', 8080))
-    thread = Thread(target=lambda: app.run(host='0.0.0.0', port=port, debug=False))
-    thread.daemon = True
-    thread.start()
+    site = web.TCPSite(_runner, host='0.0.0.0', port=port)
+    await site.start()
     print(f"🚀 Servidor de Webhook iniciado em http://0.0.0.0:{port}")